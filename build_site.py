@@ -1,60 +1,74 @@
 #!/usr/bin/env python3
 
-from core.api import Evento, Sesion, AnonApi
+from core.api import Evento, Sesion, AnonApi, sort_eventos
 from core.j2 import Jnj2, toTag
 from datetime import datetime, timedelta
 from core.log import config_log
 from core.rss import EventosRss
-from core.img import MyImage
+from core.img import get_thumbnail, Thumbnail
 from core.util import dict_add, safe_get_list_dict, safe_get_dict, get_domain, to_datetime
 import logging
 from os import environ
-from os.path import isfile
-from typing import Dict, Set, Tuple, List
+from typing import Dict, Set, Tuple
 from statistics import multimode
 from core.filemanager import FM
-from core.ics import IcsEvent
-import math
+from core.ics import IcsEvent, IcsWriter
+from core.manifest import Manifest, get_file_hash
+from core.perf import Phases
+from core.cachestats import dump_report
+from core.ratelimit import RATE_LIMITER
+from core.transport import HTTP_STATS
+from dataclasses import asdict
 import bs4
 import re
 import argparse
-import time
-from requests import Session
-import random
-from requests.exceptions import ConnectionError
-from urllib3.exceptions import ProtocolError
-from http.client import RemoteDisconnected
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 
-def get_env_int(name: str):
-    sd = environ.get(name)
-    if sd is None or not sd.isdigit():
-        return 0
-    return int(sd)
-
-
-SESSION_DELAY = get_env_int("SESSION_DELAY")
-
-if SESSION_DELAY > 0:
-    s_request = Session.request
-
-    def delayed_request(*args, **kwargs):
-        delay = random.uniform(1, SESSION_DELAY)
-        time.sleep(delay)
-        for i in range(1, 3):
-            try:
-                return s_request(*args, **kwargs)
-            except (ConnectionError, ProtocolError, RemoteDisconnected):
-                time.sleep(10*i)
-        return s_request(*args, **kwargs)
+environ['IS_ANON'] = "true"
 
-    Session.request = delayed_request
+if environ.get("BENCH_FIXTURES"):
+    from core.standin import install
+    install(environ["BENCH_FIXTURES"])
 
-environ['IS_ANON'] = "true"
+if environ.get("CASSETTE"):
+    from core.cassette import install as install_cassette
+    cassette = install_cassette(environ["CASSETTE"])
 
 parser = argparse.ArgumentParser(
     description='Listar eventos de https://www.abonoteatro.com/')
+parser.add_argument(
+    '--jobs', type=int, default=1,
+    help='Número de procesos para generar las miniaturas de los carteles'
+)
+parser.add_argument(
+    '--crawlers', type=int, default=1,
+    help='Número de hilos para descargar el detalle y las sesiones de los eventos'
+)
+parser.add_argument(
+    '--per-host', type=int, default=2,
+    help='Máximo de peticiones simultáneas contra un mismo host'
+)
+parser.add_argument(
+    '--aio', type=int, default=0,
+    help='Descargar antes con asyncio el detalle y las sesiones que no están en caché (número de peticiones simultáneas)'
+)
+parser.add_argument(
+    '--preload', type=int, default=0,
+    help='Leer antes con varios hilos el detalle y las sesiones que ya están en caché (número de hilos)'
+)
+parser.add_argument(
+    '--bench', type=str, default=None,
+    help='Fichero json donde guardar el tiempo y la memoria de cada fase'
+)
+parser.add_argument(
+    '--prom', type=str, default=None,
+    help='Fichero donde guardar las estadísticas de las cachés en formato Prometheus'
+)
+parser.add_argument(
+    '--full', action='store_true',
+    help='Regenera todos los ficheros aunque no hayan cambiado sus datos'
+)
 
 args = parser.parse_args()
 PAGE_URL = environ['PAGE_URL']
@@ -62,9 +76,10 @@ OUT = "out/"
 
 config_log("log/build_site.log")
 logger = logging.getLogger(__name__)
+phases = Phases()
 now = datetime.now()
 too_old = (now - timedelta(days=7)).strftime("%Y-%m-%d 00:00")
-white = (255, 255, 255)
+manifest = Manifest("rec/manifest.json", full=args.full)
 fechas_url = PAGE_URL+'/fechas.json'
 evento_url = PAGE_URL+'/eventos.json'
 
@@ -87,63 +102,50 @@ def safe_get_fechas():
     return fechas
 
 
-def distance_to_white(*color) -> Tuple[int]:
-    arr = []
-    for c in color:
-        d = math.sqrt(sum([(c1 - c2) ** 2 for c1, c2 in zip(c, white)]))
-        arr.append(d)
-    return tuple(arr)
-
-
-def get_trim_image(im: MyImage):
-    tr = im.trim()
-    if tr is None or tr.isKO:
-        return None
-    if (im.isLandscape and tr.isPortrait):
-        return tr
-    if len(set(im.im.size).intersection(tr.im.size)) == 1:
-        return tr
-    diff_height = abs(im.im.height-tr.im.height)
-    diff_width = abs(im.im.width-tr.im.width)
-    if diff_height < (im.im.height*0.10) and diff_width > (im.im.width*0.20):
-        return tr
-    if diff_width < (im.im.width*0.10) and diff_height > (im.im.height*0.20):
-        return tr
-    dist = distance_to_white(im.get_corner_colors().get_most_common())
-    if max(dist) < 260:
-        return tr
-    return None
-
-
 def add_image(e: Evento):
     local = f"img/{e.id}.jpg"
-    file = OUT+local
-    im = MyImage.get(e.img)
-    if isfile(file):
-        lc = MyImage(file, parent=im, background=im.background)
-    else:
-        if im.isKO:
-            return (im, e)
-        width = 500
-        height = [im.im.height, 300, width*(9/16)]
-        im = get_trim_image(im) or im
-        tb = im.thumbnail(width=width, height=min(height))
-        if tb is None or tb.isKO:
-            return (im, e)
-        lc = tb.save(file, quality=80)
-        if lc is None or lc.isKO:
-            return (im, e)
-    lc.url = PAGE_URL+'/'+local
-    return (lc, e)
+    im = get_thumbnail(e.img, OUT+local)
+    if im.path == OUT+local:
+        im.url = PAGE_URL+'/'+local
+    return (im, e)
+
+
+def add_images(eventos: Tuple[Evento], jobs: int = 1):
+    if jobs < 2:
+        return tuple(map(add_image, eventos))
+    files = tuple(f"{OUT}img/{e.id}.jpg" for e in eventos)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        thumbnails = tuple(executor.map(
+            Thumbnail.build,
+            (e.img for e in eventos),
+            files
+        ))
+    img_eventos = []
+    for e, tb in zip(eventos, thumbnails):
+        if tb is None:
+            img_eventos.append(add_image(e))
+            continue
+        im = tb.to_image()
+        im.url = f"{PAGE_URL}/img/{e.id}.jpg"
+        img_eventos.append((im, e))
+    return tuple(img_eventos)
 
 
+phases.start("fechas")
 logger.info("Recuperar fechas de publicación")
 fechas = safe_get_fechas()
 logger.info(f"{len(fechas)} fechas recuperadas")
 publish = {k: v['publicado'] for k, v in fechas.items()}
 
+phases.start("eventos")
 logger.info("Recuperar eventos")
-eventos = list(AnonApi(publish=publish).get_events())
+eventos = list(AnonApi(
+    publish=publish,
+    workers=args.crawlers,
+    per_host=args.per_host,
+    aio=args.aio,
+    preload=args.preload
+).get_events())
 logger.info(f"{len(eventos)} recuperados")
 categorias = {}
 lugares = {}
@@ -202,56 +204,31 @@ precio = dict(
 )
 
 
-def mysorted(eventos: List[Evento]):
-    def get_key(e: Evento):
-        return (e.titulo.lower(), e.lugar.direccion.strip().split()[-1])
-    arr1 = sorted(
-        eventos,
-        key=lambda e: (
-            e.publicado,
-            e.creado or e.publicado,
-            e.precio,
-            len(e.sesiones),
-            e.txt,
-            e.id
-        )
-    )
-    arr2 = []
-    for i1, e1 in enumerate(arr1):
-        if e1 in arr2:
-            continue
-        arr2.append(e1)
-        for e2 in arr1[i1+1:]:
-            if get_key(e1) == get_key(e2):
-                arr2.append(e2)
-    return tuple(reversed(arr2))
-
-
-eventos: Tuple[Evento] = mysorted(eventos)
+eventos: Tuple[Evento] = sort_eventos(eventos)
 
+phases.start("ics")
 logger.info("Añadiendo ics")
-icsevents: Dict[str, List[IcsEvent]] = defaultdict(list)
+ics_writer = IcsWriter(force=args.full)
 for e in eventos:
     for s in e.sesiones:
         ics = event_to_ics(e, s)
         if ics is not None:
-            ics.dumpme(f"out/cal/{e.id}_{s.id}.ics")
-            icsevents['eventos'].append(ics)
-            icsevents[e.categoria].append(ics)
-
-for name, evs in icsevents.items():
-    IcsEvent.dump(f"out/{name}.ics", *evs)
+            ics_writer.add(f"out/cal/{e.id}_{s.id}.ics", ics)
+            ics_writer.add("out/eventos.ics", ics)
+            ics_writer.add(f"out/{e.categoria}.ics", ics)
+ics_writer.write()
 
+phases.start("imagenes")
 logger.info("Añadiendo imágenes")
-img_eventos = tuple(map(add_image, eventos))
+img_eventos = add_images(eventos, jobs=args.jobs)
+phases.start("web")
 logger.info("Creando web")
 
 FM.dump("out/fechas.json", fechas)
 
 
-def set_icons(html: str, **kwargs):
+def set_icons(soup: bs4.BeautifulSoup, **kwargs):
     a: bs4.Tag
-    soup = bs4.BeautifulSoup(html, 'html.parser')
     for a in soup.findAll("a", string=re.compile(r"\s*🔗\s*")):
         txt = a.get_text().strip()
         href = a.attrs["href"]
@@ -277,10 +254,9 @@ def set_icons(html: str, **kwargs):
         }.get(dom)
         if tit and not a.attrs.get("title"):
             a.attrs["title"] = tit
-    return str(soup)
 
 
-j = Jnj2("template/", OUT, favicon="🎭", post=set_icons)
+j = Jnj2("template/", OUT, favicon="🎭", transformers=(set_icons, ))
 j.create_script(
     "rec/info.js",
     EVENTOS=set((e.id for e in eventos)),
@@ -302,22 +278,51 @@ j.save(
     ) if sesiones else None
 )
 
+evento_mtime = j.get_mtime("evento.html")
 for img, e in img_eventos:
+    destino = f"e/{e.id}.html"
+    if not manifest.is_changed(
+        OUT+destino,
+        asdict(e),
+        get_file_hash(f"rec/detail/{e.id}.html"),
+        evento_mtime,
+        (get_file_hash(img.path) if img.path else None, img.url, img.background, img.orientation),
+        precio
+    ):
+        continue
     j.save(
         "evento.html",
-        destino=f"e/{e.id}.html",
+        destino=destino,
         e=e,
         img=img,
-        precio=precio,
-        now=now,
-        count=len(eventos)
+        precio=precio
     )
 
+phases.start("rss")
 logger.info("Creando rss")
-EventosRss(
-    destino=OUT,
-    root=PAGE_URL,
-    eventos=eventos
-).save("abonoteatro.rss")
+if manifest.is_changed(OUT+"abonoteatro.rss", PAGE_URL, [asdict(e) for e in eventos]):
+    EventosRss(
+        destino=OUT,
+        root=PAGE_URL,
+        eventos=eventos
+    ).save("abonoteatro.rss")
+
+manifest.save()
+phases.stop()
+if args.bench:
+    phases.dump(args.bench)
+
+http = HTTP_STATS.dump("log/http.json")
+for pattern, st in dump_report("log/cache.json", prom=args.prom, extra=(HTTP_STATS.to_prometheus(), )).items():
+    if st['hits'] + st['misses'] == 0:
+        continue
+    logger.info(f"{pattern}: {st['hits']} leídas ({st['memory_hits']} de memoria), {st['misses']} calculadas, {st['not_modified']} sin cambios")
+for host, st in RATE_LIMITER.get_report().items():
+    logger.info(f"{host}: {st['count']} peticiones, {st['waited']}s esperando")
+if environ.get("CASSETTE"):
+    logger.info(f"Cassette: {cassette.records} grabadas, {cassette.hits} reproducidas, {cassette.misses} sin grabar")
+for host, st in http.items():
+    retries = sum(st['retries'].values())
+    logger.info(f"{host}: {st['requests']} peticiones en {st['latency']['sum']:.1f}s, {retries} reintentos, {st['errors']} errores")
 
 logger.info("Fin")
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Dict, Mapping, Tuple
+
+import aiohttp
+
+from .web import default_headers, buildSoup
+from .ratelimit import RATE_LIMITER
+
+
+class AioWeb:
+    """
+    Cliente http asíncrono que reutiliza las conexiones, limita el número
+    de peticiones simultáneas y aplica un timeout a cada petición.
+    Devuelve lo mismo que Web.get (el html parseado con las urls absolutas)
+
+        async with AioWeb(concurrency=10) as w:
+            soup = await w.get(url)
+    """
+
+    def __init__(self, concurrency: int = 10, timeout: float = 30, cookies: Dict[str, str] = None, headers: Dict[str, str] = None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cookies = cookies
+        # aiohttp pone el Accept-Encoding que sabe descomprimir
+        self.headers = {k: v for k, v in (headers or default_headers).items() if k != 'Accept-Encoding'}
+        self.__semaphore: asyncio.Semaphore = None
+        self.__session: aiohttp.ClientSession = None
+
+    async def __aenter__(self):
+        self.__semaphore = asyncio.Semaphore(self.concurrency)
+        self.__session = aiohttp.ClientSession(
+            headers=self.headers,
+            cookies=self.cookies,
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self.__session.close()
+
+    async def get_bytes(self, url: str, headers: Dict[str, str] = None, **kwargs) -> bytes:
+        content, _ = await self.get_response(url, headers=headers, **kwargs)
+        return content
+
+    async def get_response(self, url: str, headers: Dict[str, str] = None, **kwargs) -> Tuple[bytes, Mapping[str, str]]:
+        """
+        Contenido y cabeceras de la respuesta
+        """
+        delay = RATE_LIMITER.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self.__semaphore:
+            if kwargs:
+                rq = self.__session.post(url, headers=headers, data=kwargs)
+            else:
+                rq = self.__session.get(url, headers=headers)
+            async with rq as r:
+                # ClientResponseError: que no se guarde una página de error como si fuera la buena
+                r.raise_for_status()
+                return await r.read(), r.headers
+
+    async def get(self, url: str, headers: Dict[str, str] = None, parser="lxml", **kwargs):
+        content = await self.get_bytes(url, headers=headers, **kwargs)
+        return buildSoup(url, content, parser=parser)
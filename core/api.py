@@ -3,20 +3,32 @@ from os import environ
 from selenium.webdriver.common.by import By
 from typing import NamedTuple, Tuple, Set, Dict, List, Union
 import re
-from bs4 import Tag, BeautifulSoup
+import time
+from bs4 import Tag, BeautifulSoup, SoupStrainer
 from datetime import datetime, date
-from .cache import Cache
+from .cache import Cache, StaticCache, CACHE_COMPRESS
+from .snapshot import Snapshot
+from .preload import Preloader
 import logging
 from functools import cached_property
 import base64
+import hashlib
 import json
 from urllib.parse import quote
-from .util import get_joins, clean_js_obj, clean_txt, get_obj, trim, get_text, clean_html, simplify_html, re_or, re_and, plain_text
+from .util import get_joins, clean_js_obj, clean_txt, get_obj, trim, get_text, clean_html, simplify_html, re_or, re_and, plain_text, scrub_url
+from .category import CATEGORY_RULES, CategoryFields, ID_CATEGORIA
 from .wpjson import WP
 from dataclasses import dataclass, asdict, is_dataclass
 from urllib.parse import quote_plus
 from .img import MyImage
-from core.web import Web
+from core.web import Web, HostLimit, DriverPool, buildSoup
+from concurrent.futures import ThreadPoolExecutor
+from threading import local, Lock
+from itertools import chain
+import asyncio
+import aiohttp
+from .aioweb import AioWeb
+from .revalidation import Revalidation, get_request_signature
 
 
 from .filemanager import FM
@@ -25,6 +37,8 @@ logger = logging.getLogger(__name__)
 re_filmaffinity = re.compile(r"https://www.filmaffinity.com/es/film\d+.html")
 
 re_sp = re.compile(r"\s+")
+# cambiar si cambia Evento.derive para invalidar rec/derived
+DERIVED_VERSION = 1
 MONTHS = ("ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sep", "oct", "nov", "dic")
 NOW = datetime.now().strftime("%Y-%m-%d %H:%S")
 
@@ -34,13 +48,28 @@ def get_slug(url: str):
 
 
 class TupleCache(Cache):
-    def __init__(self, *args, builder=None, **kwargs):
+    def __init__(self, *args, builder=None, snapshot: Snapshot = None, **kwargs):
+        """
+        Parameters
+        ----------
+        snapshot: Snapshot
+            además del json (que se mantiene para consultarlo a mano) guarda
+            la colección en fichero.snap, que se lee antes que el json si no es más antiguo
+        """
         if not callable(builder):
             raise ValueError('builder is None')
         self.builder = builder
+        self.snapshot = snapshot
         super().__init__(*args, **kwargs)
 
+    def get_snapshot_file(self, file):
+        return str(FM.compressed(file).with_suffix(".snap"))
+
     def read(self, file, *args, **kwargs):
+        if self.snapshot is not None:
+            data = self.__read_snapshot(file)
+            if data is not None:
+                return data
         data = super().read(file, *args, **kwargs)
         if isinstance(data, dict):
             return self.builder(data)
@@ -57,9 +86,43 @@ class TupleCache(Cache):
             obj = {k: self.__parse(v) for k, v in obj.items()}
         return obj
 
+    def __read_snapshot(self, file):
+        snap = self.get_snapshot_file(file)
+        st_snap = FM.stat(snap)
+        st = self.stat(file)
+        # si el json es posterior (por ejemplo editado a mano) manda el json
+        if st_snap is None or st is None or st_snap.st_mtime < st.st_mtime:
+            return None
+        return self.snapshot.loads(FM.read_bytes(snap))
+
     def save(self, file, data, *args, **kwargs):
-        data = self.__parse(data)
-        return super().save(file, data, *args, **kwargs)
+        snap = None
+        if file is not None and self.snapshot is not None and self.snapshot.accept(data):
+            snap = self.snapshot.dumps(data)
+        super().save(file, self.__parse(data), *args, **kwargs)
+        if snap is None:
+            return
+        # después del json para que el snapshot no sea más antiguo
+        file = self.get_snapshot_file(file)
+        if FM.store is not None and self.in_store:
+            FM.store.put(FM.get_key(file), snap, FM.get_content_type(file))
+        else:
+            if FM.store is not None:
+                FM.store.delete(FM.get_key(file))
+            FM.dump(file, snap)
+        self.stats.add(bytes_written=len(snap))
+
+
+class HashCache(StaticCache):
+    """
+    La entrada solo es válida si su campo hash coincide con el argumento hash
+    """
+
+    def memo_read(self, fl, st, *args, hash: str = None, **kwargs):
+        data = super().memo_read(fl, st, *args, hash=hash, **kwargs)
+        if not isinstance(data, dict) or data.get('hash') != hash:
+            return None
+        return data
 
 
 class UrlCache(Cache):
@@ -153,6 +216,31 @@ class Evento:
     def merge(self, **kwargs):
         return Evento(**{**asdict(self), **kwargs})
 
+    def to_row(self):
+        return (
+            self.id,
+            self.img,
+            self.precio,
+            self.categoria,
+            tuple(self.lugar),
+            tuple(map(tuple, self.sesiones)),
+            self.txt,
+            self.subtitulo,
+            self.creado,
+            self.publicado
+        )
+
+    @staticmethod
+    def from_row(row: Tuple):
+        """
+        Inversa de to_row sin pasar por __post_init__ (los textos ya están limpios)
+        """
+        e = object.__new__(Evento)
+        e.__dict__.update(zip(EVENTO_FIELDS, row))
+        e.__dict__['lugar'] = Lugar._make(e.lugar)
+        e.__dict__['sesiones'] = tuple(map(Sesion._make, e.sesiones))
+        return e
+
     @staticmethod
     def build(*args, **kwargs):
         obj = get_obj(*args, **kwargs)
@@ -191,7 +279,7 @@ class Evento:
         txt = quote_plus(title)
         if self.categoria == "cine":
             w = Web()
-            w.get("https://www.filmaffinity.com/es/search.php?stext="+txt)
+            w.fetch("https://www.filmaffinity.com/es/search.php?stext="+txt)
             if re_filmaffinity.match(w.url):
                 return w.url
             lwtitle = title.lower()
@@ -208,7 +296,48 @@ class Evento:
             return BeautifulSoup(clean_html(str(soup)), "html.parser")
 
     @cached_property
-    def fichahtml(self):
+    def derived(self) -> Dict:
+        """
+        Lo que se obtiene del detalle del evento (ver Evento.derive)
+        guardado en rec/derived/{id}.json y reutilizado mientras no cambie el detalle
+        """
+        content = FM.read_bytes(f"rec/detail/{self.id}.html")
+        if content is None:
+            return self.derive()
+        h = hashlib.sha256(f"{DERIVED_VERSION}\n".encode() + content).hexdigest()
+        return get_derived(self.id, hash=h, evento=self)
+
+    def derive(self, hash: str = None):
+        """
+        fichahtml: la ficha del evento simplificada
+        dias: si solo es válido de lunes a jueves (L-J) o lunes, martes y jueves (L,M,J)
+        infantil: si la ficha indica que es un evento infantil
+        """
+        fichahtml = self.__fichahtml()
+        dias = None
+        if fichahtml is not None:
+            if re.search(r"V[áa]lid[oa]s?.*?de lunes a jueves", fichahtml, flags=re.IGNORECASE):
+                dias = "L-J"
+            if re.search(r"V[áa]lid[oa]s?.*?lunes, martes y jueves", fichahtml, flags=re.IGNORECASE):
+                dias = "L,M,J"
+        i = plain_text(fichahtml, is_html=True)
+        infantil = bool(re_or(
+            i,
+            "los mas pequeños",
+            "publico infantil",
+            "espectaculo recomendado para niños",
+            "a partir de 3 años",
+            "la niñez que llevamos dentro",
+            "pirata garrapata"
+        ) or re_and(i, "niños", "familiar"))
+        return dict(
+            hash=hash,
+            fichahtml=fichahtml,
+            dias=dias,
+            infantil=infantil
+        )
+
+    def __fichahtml(self):
         n = self.html.select_one("#informacioneventolargo")
         if n is None:
             return None
@@ -225,15 +354,15 @@ class Evento:
         n.attrs.clear()
         return str(n)
 
+    @property
+    def fichahtml(self):
+        return self.derived['fichahtml']
+
     @cached_property
     def dias_hora(self):
         dias: Dict[str, List[Sesion]] = {}
         for e in self.sesiones:
-            dia = 'Cualquier día'
-            if re.search(r"V[áa]lid[oa]s?.*?de lunes a jueves", self.fichahtml, flags=re.IGNORECASE):
-                dia = "L-J"
-            if re.search(r"V[áa]lid[oa]s?.*?lunes, martes y jueves", self.fichahtml, flags=re.IGNORECASE):
-                dia = "L,M,J"
+            dia = self.derived['dias'] or 'Cualquier día'
             if e.fecha is not None:
                 dh = e.fecha.split(" ")
                 if len(dh[0]) == 10:
@@ -258,20 +387,7 @@ class Evento:
         t = plain_text(self.titulo)
         if re_or(t, "para niños", "familiar", "infantil"):
             return True
-        i = plain_text(self.fichahtml, is_html=True)
-        if re_or(
-            i,
-            "los mas pequeños",
-            "publico infantil",
-            "espectaculo recomendado para niños",
-            "a partir de 3 años",
-            "la niñez que llevamos dentro",
-            "pirata garrapata"
-        ):
-            return True
-        if re_and(i, "niños", "familiar"):
-            return True
-        return False
+        return self.derived['infantil']
 
     @staticmethod
     def create(js: Dict, detail: Tag, categoria: str, sesiones: Tuple[Sesion]):
@@ -290,6 +406,43 @@ class Evento:
         )
 
 
+# cambiar si cambia Evento.to_row para invalidar rec/eventos.snap
+EVENTO_SNAPSHOT = Snapshot(Evento, version=1)
+EVENTO_FIELDS = EVENTO_SNAPSHOT.fields
+
+
+@HashCache("rec/derived/{}.json", maxOld=None)
+def get_derived(id: int, hash: str = None, evento: Evento = None):
+    return evento.derive(hash=hash)
+
+
+def sort_eventos(eventos: List[Evento]) -> Tuple[Evento]:
+    """
+    Ordena los eventos del más reciente al más antiguo manteniendo
+    consecutivos los que tienen el mismo título y lugar
+    """
+    def get_key(e: Evento):
+        return (e.titulo.lower(), e.lugar.direccion.strip().split()[-1])
+    arr = sorted(
+        eventos,
+        key=lambda e: (
+            e.publicado,
+            e.creado or e.publicado,
+            e.precio,
+            len(e.sesiones),
+            e.txt,
+            e.id
+        )
+    )
+    groups: Dict[Tuple[str, str], List[Evento]] = {}
+    for e in arr:
+        k = get_key(e)
+        if k not in groups:
+            groups[k] = []
+        groups[k].append(e)
+    return tuple(reversed(tuple(chain.from_iterable(groups.values()))))
+
+
 class ApiException(Exception):
     pass
 
@@ -299,17 +452,48 @@ PSW = environ.get("ABONOTEATRO_PSW")
 
 
 class PortalDriver(Driver):
+    LOGIN = "https://compras.abonoteatro.com/login/"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__session: Set[str] = set()
+
     def login(self, user: str = USER, psw: str = PSW):
         environ['IS_ANON'] = "false"
-        self.get("https://compras.abonoteatro.com/login/")
+        self.get(PortalDriver.LOGIN)
         self.val("nabonadologin", user)
         self.val("contrasenalogin", psw)
         self.click('button.cmplz-deny', by=By.CSS_SELECTOR)
         self.click(
             '#dformrlogin input[type="button"].buyBtn', by=By.CSS_SELECTOR)
         self.wait(Api.IFRAME, by=By.CSS_SELECTOR)
+        self.__session = self.__get_cookies()
         logger.info("login OK")
 
+    def __get_cookies(self):
+        now = time.time()
+        return set(
+            c['name'] for c in self.driver.get_cookies()
+            if c.get('expiry') is None or c['expiry'] > now
+        )
+
+    @property
+    def logged(self):
+        """
+        Siguen vigentes las cookies que se obtuvieron al hacer login
+        """
+        if not self.__session or not self.alive:
+            return False
+        return self.__session.issubset(self.__get_cookies())
+
+    @property
+    def expired(self):
+        """
+        El portal ha redirigido a la página de login
+        """
+        url = self.current_url
+        return url is not None and url.startswith(PortalDriver.LOGIN)
+
     def get(self, url):
         if self.current_url == url:
             return
@@ -342,6 +526,13 @@ class PortalDriver(Driver):
         return None
 
 
+# navegadores con la sesión iniciada que se reutilizan durante toda la ejecución
+PORTAL_POOL = DriverPool(
+    lambda: PortalDriver("firefox", human_delay=3),
+    size=int(environ.get("DRIVER_POOL_SIZE") or 1)
+)
+
+
 class Api:
     IFRAME = 'div[role="main"] iframe'
     BTNDAY = "div.bsesion a.buyBtn"
@@ -354,18 +545,31 @@ class Api:
         #"https://www.abonoteatro.com/catalogo/cine_peliculas.php",
     )
 
-    def __init__(self, publish=None):
+    def __init__(self, publish=None, workers: int = 1, per_host: int = 2, preload: int = 0):
+        """
+        Parameters
+        ----------
+        preload: int
+            si es > 0 antes de recorrer un catálogo se leen con preload hilos
+            los detalles y sesiones que ya están en caché (ver core.preload)
+        """
         self._w = None
+        self._local = local()
+        self.__lock = Lock()
         self.__base64: Dict[str, str] = {}
         self.__types = None
         self.publish: Dict[int, str] = publish or {}
+        self.workers = workers
+        self.per_host = per_host
+        self.preload = preload
 
-    def get(self, url, *args, label_log=None, **kwargs):
-        if self.w.url == url and len(args) == 0 and len(kwargs) == 0:
+    def get(self, url, *args, label_log=None, strainer: SoupStrainer = None, **kwargs):
+        # la página ya cargada solo vale si se parseó (o se va a parsear) entera
+        if self.w.url == url and len(args) == 0 and len(kwargs) == 0 and strainer is None and not self.w.strained:
             return
-        self.w.get(url, *args, **kwargs)
+        self.w.fetch(url, *args, strainer=strainer, **kwargs)
         log = (str(label_log)+":" if label_log is not None else "")
-        url_log = re.sub(r"\btoken=\w+", "token=***", url)
+        url_log = scrub_url(url)
         if kwargs:
             logger.info(f"{log} POST {url_log}".strip())
         else:
@@ -373,6 +577,9 @@ class Api:
         self._find_types()
 
     def _find_types(self):
+        # evita parsear respuestas que no tienen el desplegable
+        if self.w.content is None or b"select_type_event" not in self.w.content:
+            return
         options = self.w.soup.select("#select_type_event option")
         if len(options) == 0:
             return
@@ -394,19 +601,24 @@ class Api:
         return self.__types
 
     @property
-    def w(self):
+    def w(self) -> Web:
+        w = getattr(self._local, "w", None)
+        if w is not None:
+            return w
         if self._w is None:
-            with PortalDriver("firefox", human_delay=3) as w:
-                w.login()
-                self._w = w.to_web()
+            self._w = self._new_web()
         return self._w
 
+    def _new_web(self):
+        with PORTAL_POOL.lease() as w:
+            return w.to_web()
+
     @cached_property
     def wp(self):
         w = WP(self.w.s, "https://compras.abonoteatro.com")
         return w
 
-    @TupleCache("rec/eventos.json", builder=Evento.build)
+    @TupleCache("rec/eventos.json", builder=Evento.build, snapshot=EVENTO_SNAPSHOT, in_store=False)
     def get_events(self):
         evs: Dict[int, Evento] = {}
         for url in self.CATALOG:
@@ -448,20 +660,59 @@ class Api:
 
     def get_events_from(self, url):
         evs: Set[Evento] = set()
-        for js in self.get_js_events(url):
-            if js['name'] == "Compra o Regala ABONOTEATRO":
-                continue
-            id = js['id']
-            detail = self.get_soup_detail(id)
+        jss = tuple(js for js in self.get_js_events(url) if js['name'] != "Compra o Regala ABONOTEATRO")
+        if self.preload > 0:
+            self.__preload(jss)
+        for js, (detail, sesiones) in zip(jss, self.__crawl(jss)):
             evs.add(Evento.create(
                 js=js,
                 detail=detail,
                 categoria=self.find_category(url, js),
-                sesiones=self.find_days(js['id'])
+                sesiones=sesiones
             ))
         return tuple(sorted(evs))
 
-    @UrlCache("rec/event/{}.json")
+    def __preload(self, jss: Tuple[Dict]):
+        """
+        Deja en memoria, en el orden en el que se van a usar, los detalles
+        en caché y las sesiones que no se pueden sacar del detalle
+        """
+        detail: Cache = Api.get_soup_detail.__cache_obj__
+        day: Cache = Api.get_soup_day.__cache_obj__
+
+        def task(pre: Preloader, id: int):
+            soup = pre.load(detail, id)
+            if soup is None:
+                return
+            for did, a in self._iter_days(soup):
+                if self._parse_day(did, a) is None:
+                    pre.load(day, did)
+
+        Preloader(workers=self.preload).run(task, ((js['id'], ) for js in jss))
+
+    def __crawl(self, jss: Tuple[Dict]):
+        """
+        Devuelve el detalle y las sesiones de cada evento en el mismo orden que jss.
+        Si workers > 1 las peticiones se reparten entre varios hilos, cada uno con
+        su propia sesión (que comparte las cookies de self.w) y sin superar
+        per_host peticiones simultáneas contra el mismo host
+        """
+        if self.workers < 2:
+            return map(self.__crawl_event, jss)
+        w = self.w
+        host_limit = HostLimit(self.per_host)
+
+        def init_worker():
+            self._local.w = w.clone(host_limit=host_limit)
+
+        with ThreadPoolExecutor(max_workers=self.workers, initializer=init_worker) as executor:
+            return tuple(executor.map(self.__crawl_event, jss))
+
+    def __crawl_event(self, js: Dict):
+        detail = self.get_soup_detail(js['id'])
+        return detail, self.find_days(js['id'])
+
+    @UrlCache("rec/event/{}.json", revalidate=True)
     def get_js_events(self, url: str):
         evs: Dict[int, Dict] = {}
         for id, value, data in self.get_base64_event(url):
@@ -492,9 +743,12 @@ class Api:
         npts = self.w.soup.select('input[type="hidden"]')
         if len(npts) > 0:
             return npts
-        with PortalDriver("firefox", human_delay=3) as w:
-            w.login()
+        with PORTAL_POOL.lease() as w:
             w.get(url)
+            if w.expired:
+                logger.info("Sesión caducada, se vuelve a hacer login")
+                w.login()
+                w.get(url)
             iframe = w.safe_wait(Api.IFRAME, by=By.CSS_SELECTOR, seconds=5)
             if iframe is not None:
                 src = iframe.get_attribute("src")
@@ -515,7 +769,7 @@ class Api:
             raise ApiException(f"0 eventos en {url}")
         return npts
 
-    @Cache("rec/detail/{}.html")
+    @Cache("rec/detail/{}.html", revalidate=True, compress=CACHE_COMPRESS)
     def get_soup_detail(self, id: int):
         self.get(Api.DETAIL, action='show',
                  content=self.get_base64(id), label_log=id)
@@ -525,14 +779,23 @@ class Api:
         return self.w.soup
 
     def get_base64(self, id: int):
-        if id not in self.__base64:
-            for url in self.CATALOG:
-                list(self.get_base64_event(url))
-        return self.__base64.get(id)
+        with self.__lock:
+            if id not in self.__base64:
+                for url in self.CATALOG:
+                    list(self.get_base64_event(url))
+            return self.__base64.get(id)
 
     def find_days(self, id: int):
-        arr = []
         soup = self.get_soup_detail(id)
+        ses: Set[Sesion] = set()
+        for did, a in self._iter_days(soup):
+            ses.add(self.__get_day(did, a))
+        if len(ses) == 0:
+            logger.warning(f"{id} no se han encontrado sesiones")
+        return tuple(sorted(ses, key=lambda s: (s.fecha, s.id)))
+
+    def _iter_days(self, soup: Tag):
+        arr = []
         for a in soup.select(Api.BTNDAY):
             href = a.attrs["href"]
             if not href.startswith(Api.URLDAY):
@@ -541,31 +804,36 @@ class Api:
             if not did.isdigit():
                 raise ApiException("URL de sesión extraña: "+href)
             arr.append((int(did), a))
-        ses: Set[Sesion] = set()
-        for did, a in arr:
-            ses.add(self.__get_day(did, a))
-        if len(ses) == 0:
-            logger.warning(f"{id} no se han encontrado sesiones")
-        return tuple(sorted(ses, key=lambda s: (s.fecha, s.id)))
+        return tuple(arr)
 
     def __get_day(self, id: int, a: Tag):
+        ses = self._parse_day(id, a)
+        if ses is None:
+            return self.__visit_day(id)
+        return ses
+
+    def _parse_day(self, id: int, a: Tag) -> Union[Sesion, None]:
+        """
+        Obtiene la sesión a partir del botón de compra del detalle del evento
+        o devuelve None si hay que visitar la página de la sesión
+        """
         div = a.find_parent("div", class_=re.compile(r".*\bbsesion\b.*"))
         hm = get_text(a)
         if hm is None or not re.match(r"^\d+:\d+$", hm):
             hm = get_text(div.select_one("h3.horasesion"))
         if hm is None or not re.match(r"^\d+:\d+$", hm):
-            return self.__visit_day(id)
+            return None
         fch = tuple(map(get_text, div.select("div.bfechasesion > p")))
         if len(fch) != 3 or not fch[1].isdigit():
-            return self.__visit_day(id)
+            return None
         day = int(fch[1])
         my = fch[0].split()
         if len(my) != 2 or not my[1].isdigit():
-            return self.__visit_day(id)
+            return None
         year = int(my[1])
         m = my[0].lower()[:3]
         if m not in MONTHS:
-            return self.__visit_day(id)
+            return None
         month = MONTHS.index(m) + 1
         h, m = map(int, hm.split(":"))
         return Sesion(
@@ -593,7 +861,7 @@ class Api:
             fecha = datetime(2000, 1, 1, *hora, 0, 0).strftime("%H:%M")
         return Sesion(id=id, fecha=fecha)
 
-    @Cache("rec/day/{}.html")
+    @Cache("rec/day/{}.html", revalidate=True, compress=CACHE_COMPRESS)
     def get_soup_day(self, id: int):
         url = Api.URLDAY + str(id)
         self.get(url)
@@ -607,164 +875,18 @@ class Api:
         cat = js['id_categoria']
         img = MyImage.get(js['image'])
 
-        def _or(s: str, *args):
-            b = re_or(s, *args)
-            if b is not None:
-                logger.debug(f"{_id} cumple {b}")
-                return True
-            return False
-
-        def _and(s: str, *args):
-            b = re_and(s, *args)
-            if b is not None:
-                logger.debug(f"{_id} cumple {b}")
-                return True
-            return False
-
         path = url.rstrip("/").split("/")[-1]
         if path == "cine_peliculas.php":
             return "cine"
 
-        cabadrag = "cabaret / drag"
-        humor = "humor / impro"
-        musica = "musica / danza"
-        expomus = "exposición / museo"
-        name = plain_text(js['name'] + " "+(js['sub'] or ""))
-        if img and img.isOK and img.txt:
-            name = (name + " " + (plain_text(img.txt) or "")).strip()
-        info = plain_text((js['info'] or "")+" "+(js['condicion'] or ""), is_html=True)
-        name_info = (name+" "+(info or "")).strip()
-        recinto = plain_text(js['recinto']) or ""
-        if recinto == "wizink center baloncesto":
-            return "otros"
-        if _or(name, "visita guiada", "visita libre", "visita a la capital", "audioguia", "tour guiado"):
-            return "visita"
-        if _or(info, "antes de la hora de salida de la visita"):
-            return "visita"
-        if _or(name+" "+recinto, "autocine", "cinesa", "cinesur", "yelmo"):
-            return "cine"
-        if _and(name+" "+recinto, "mk2", ("sesion", "director")):
-            return "cine"
-        if ("eventos" not in recinto) and _or(name+" "+recinto, "mk2"):
-            return "cine"
-        if _or(name, "cines"):
-            return "cine"
-        if _or(info, "jardin botanico"):
-            return "otros"
-        if _or(name, "exposicion", "exposiciones", "museum", "museo"):
-            return expomus
-        if path == "cine-y-eventos":
-            return "otros"
-        if _or(name, "cabaret", "drag", "hole", "burlesque") or _and(info, r"gogos?", "erotismo"):
-            return cabadrag
-        if _or(name, "magic", "magia", "magos?", "mentalistas?", "hipnosis"):
-            return "magia"
-        if _or(name, "impro", "el humor de", "clown"):
-            return humor
-        if _or(name, "flamenco", "saeta flamenca"):
-            return "flamenco"
-        if _or(name, "bingo", "karaoke", "circo", "parque de atracciones"):
-            return "otros"
-        if _or(name, r"[jk]-?pop", "cocoloco", "b vocal", "opera", "musica en vivo", "jazz", "tributo", "sinfonico", "musical", "concierto", r"boleros?", "orquesta", "pianista") or _and(name, r"musical(es)?", "broadway"):
-            return musica
-        if cat == 23 and _or(name, "humor"):
-            return humor
-
-        if _or(info, "monologo narrativo"):
-            return "teatro"
-        if _or(info, "mentalismo", "espectaculo de magia", "espiritismo", "fito crawford"):
-            return "magia"
-        if _and(info, r"exposicion|expondran?", "obras"):
-            return expomus
-        if _or(
-            name_info,
-            "stand ?up",
-            "stand-up",
-            "open-mic",
-            "open ?mic",
-            "monologos",
-            "monologuistas",
-            r"impromonologos?",
-            "comedia pura",
-            "show de comedia",
-            "humor blanco",
-            "comedia totalmente improvisada",
-            "improvisacion teatral",
-            "comedy club",
-            "show improvisado",
-            "chic comedy",
-            "humor inteligente",
-            "comico ocasional",
-            "humorista",
-            "presenta su monologo",
-            "un monologo para",
-            "con un monologo que te"
-        ):
-            # imporate que 'monologos' sea en plural para no confundir con cosas que no son humor
-            return humor
-
-        if _or(
-            info,
-            r"comedias? musical(es)?",
-            r"gran(des)? musical(es)?",
-            "espectaculo musical",
-            "musical integramente cantado",
-            "viaje musical",
-            "concierto",
-            "percusion",
-            "banda sonora",
-            "cantaran sus temas",
-            "album debut"
-        ):
-            return musica
-        if _and(name_info, "clown", "humor"):
-            return humor
-        if _or(info, "mentalista", "prestidigitador", "mentalismo"):
-            return "magia"
-        if _and(info, ("humor", "humores", "risas"), ("improvisar", "improvisacion", "comicos")):
-            return humor
-        if _and(info, "show", "comicos?"):
-            return humor
-        if _or(name, "el show de"):
-            return humor
-        if recinto == "sala de humor fuencarral":
-            # importante que vaya al final
-            # porque a veces hace magia u otras cosas
-            return humor
-        if recinto == "sala houdini":
-            return "magia"
-        if _or(info, "esta obra puede herir la sensibilidad del espectador"):
-            return "teatro"
-        if _or(
-            info,
-            "podcast",
-            "globoflexia",
-            "lanzamiento de su nuevo libro"
-        ):
-            return "otros"
-        if _or(
-            info,
-            "cabaret",
-            "drags?"
-        ):
-            return cabadrag
-        if cat in (17, 19) and _or(info, "tematica erotica",  "erotismo"):
-            return cabadrag
-        categoria = {
-            11: "teatro", # teatro / teatro musical
-            15: "magia", # magia
-            17: "otros", # circo / cabaret
-            18: "otros", # conferencia
-            19: musica, # musica
-            20: "otros", # deporte
-            21: "cine", # cine
-            23: humor, # monologo
-            24: expomus, # parque tematico / exposicion
-            28: musica, # danza
-            22: musica,
-            25: "otros",
-            30: "otros", # visitas guiadas
-        }.get(cat)
+        img_txt = img.txt if (img and img.isOK) else None
+        fields = CategoryFields.build(url, js, img_txt=img_txt)
+        rule, b = CATEGORY_RULES.find(fields)
+        if rule is not None:
+            if b is not None:
+                logger.debug(f"{_id} cumple {b}")
+            return rule.categoria
+        categoria = ID_CATEGORIA.get(cat)
         if categoria is not None:
             logger.debug(f"{_id} categoria={cat} -> "+categoria)
             return categoria
@@ -777,17 +899,84 @@ class AnonApi(Api):
         'https://programacion.abonoteatro.com/catalogo/teatros2.php?token='+environ['PROGRAMA_TOKEN'],
     )
 
-    @property
-    def w(self):
-        if self._w is None:
-            self._w = Web()
-        return self._w
+    def __init__(self, *args, aio: int = 0, timeout: float = 30, **kwargs):
+        """
+        Parameters
+        ----------
+        aio: int
+            si es > 0 los detalles y sesiones que no están en caché se descargan
+            antes con AioWeb con un máximo de aio peticiones simultáneas
+        timeout: float
+            timeout en segundos de cada petición de AioWeb
+        """
+        super().__init__(*args, **kwargs)
+        self.aio = aio
+        self.timeout = timeout
+
+    def get_events_from(self, url):
+        if self.aio > 0:
+            asyncio.run(self.__aio_warm(url))
+        return super().get_events_from(url)
+
+    async def __aio_warm(self, url: str):
+        """
+        Rellena rec/detail y rec/day (con el mismo formato que get_soup_detail
+        y get_soup_day) para que get_events_from los lea de la caché
+        """
+        detail: Cache = Api.get_soup_detail.__cache_obj__
+        day: Cache = Api.get_soup_day.__cache_obj__
+        jss = tuple(js for js in self.get_js_events(url) if js['name'] != "Compra o Regala ABONOTEATRO")
+        cookies = {c.name: c.value for c in self.w.s.cookies}
+        headers = dict(self.w.s.headers)
+        async with AioWeb(concurrency=self.aio, timeout=self.timeout, cookies=cookies, headers=headers) as w:
+            todo = {}
+            for js in jss:
+                if detail.tooOld(detail.parse_file_name(js['id'])):
+                    todo[js['id']] = self.get_base64(js['id'])
+            logger.info(f"{len(todo)} detalles por descargar con {self.aio} peticiones simultáneas")
+            await asyncio.gather(*(
+                self.__aio_get(w, detail, id, "detail", Api.DETAIL, action='show', content=content)
+                for id, content in todo.items()
+            ))
+            days = set()
+            for js in jss:
+                for did, a in self._iter_days(self.get_soup_detail(js['id'])):
+                    if self._parse_day(did, a) is None and day.tooOld(day.parse_file_name(did)):
+                        days.add(did)
+            logger.info(f"{len(days)} sesiones por descargar con {self.aio} peticiones simultáneas")
+            await asyncio.gather(*(
+                self.__aio_get(w, day, did, "day", Api.URLDAY + str(did))
+                for did in sorted(days)
+            ))
+
+    async def __aio_get(self, w: AioWeb, cache: Cache, id: int, label: str, url: str, **kwargs):
+        url_log = scrub_url(url)
+        try:
+            content, headers = await w.get_response(url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # sin guardar: get_soup_detail / get_soup_day lo volverán a pedir
+            logger.warning(f"{id}: {'POST' if kwargs else 'GET'} {url_log} falló en la precarga: {e!r}")
+            return
+        logger.info(f"{id}: {'POST' if kwargs else 'GET'} {url_log}")
+        soup = buildSoup(url, content)
+        if len(re_sp.sub("", str(soup))) == 0:
+            logger.warning(f"Empty {label} in {id}")
+        fl = cache.parse_file_name(id)
+        cache.save(fl, soup)
+        if cache.revalidate:
+            # los validadores de esta respuesta (o ninguno), no los de la entrada anterior
+            rv = Revalidation()
+            rv.set_response(get_request_signature("POST" if kwargs else "GET", url, kwargs), headers)
+            cache.save_validators(fl, rv.last)
+
+    def _new_web(self):
+        return Web()
 
     def _get_list_event(self, url: str):
         self.get(url, headers={
             'Referer': 'https://compras.abonoteatro.com/',
             'Cookie': 'unabonado=;',
-        })
+        }, strainer=SoupStrainer(["input", "select"]))  # select para _find_types
         npts = self.w.soup.select('input[type="hidden"]')
         if len(npts) == 0:
             raise ApiException(f"0 eventos en {url}")
@@ -0,0 +1,76 @@
+import os
+import hashlib
+import logging
+from threading import get_ident
+from typing import Union
+
+from .filemanager import FM
+
+logger = logging.getLogger(__name__)
+
+
+def get_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class BlobStore:
+    """
+    Ficheros guardados por el sha256 de su contenido (root/ab/abcd...),
+    de manera que un mismo contenido solo se guarda una vez
+    y al leerlo se puede comprobar que no se ha corrompido
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def get_file(self, h: str) -> str:
+        return f"{self.root}/{h[:2]}/{h}"
+
+    def exists(self, h: str) -> bool:
+        if not isinstance(h, str) or len(h) != 64:
+            return False
+        return FM.exists(self.get_file(h))
+
+    def put(self, content: bytes) -> str:
+        h = get_hash(content)
+        if self.exists(h):
+            return h
+        file = self.get_file(h)
+        if FM.store is not None:
+            FM.store.put(FM.get_key(file), content, "application/octet-stream")
+            return h
+        path = FM.resolve_path(file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # escritura atómica por si otro proceso guarda el mismo contenido a la vez
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{get_ident()}.tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        return h
+
+    def get(self, h: str) -> Union[bytes, None]:
+        """
+        Contenido de h o None si no existe o está corrupto (en cuyo caso se borra)
+        """
+        if not self.exists(h):
+            return None
+        file = self.get_file(h)
+        content = FM.read_bytes(file)
+        if content is None:
+            return None
+        if get_hash(content) != h:
+            logger.warning(f"{file} está corrupto, se descarta")
+            self.delete(h)
+            return None
+        return content
+
+    def delete(self, h: str):
+        file = self.get_file(h)
+        if FM.store is not None:
+            FM.store.delete(FM.get_key(file))
+        path = FM.resolve_path(file)
+        if path.is_file():
+            path.unlink()
+
+
+# carteles descargados (rec/img/ guarda el sha256 de cada url)
+POSTERS = BlobStore("rec/poster")
@@ -1,16 +1,49 @@
 import functools
 import os
+from os import environ
 import time
 import logging
 
-from .filemanager import FM
+from .filemanager import FM, COMPRESSED, zstandard
+from .lru import CACHE_MEMORY, estimate_size
+from .revalidation import revalidation, NotModified
+from .cachestats import get_stats
 
 logger = logging.getLogger(__name__)
 
+# compresión (gz o zst) de las cachés que la aceptan (compress=CACHE_COMPRESS)
+CACHE_COMPRESS = environ.get("CACHE_COMPRESS") or None
+
 
 class Cache:
-    def __init__(self, file: str, *args, kwself=None, reload: bool = False, skip: bool = False, maxOld=1, loglevel=None, **kwargs):
+    # guardar lo leído en CACHE_MEMORY (no sirve si read devuelve algo que se consume, como un BytesIO)
+    memory = True
+
+    def __init__(self, file: str, *args, kwself=None, reload: bool = False, skip: bool = False, maxOld=1, loglevel=None, revalidate: bool = False, compress: str = None, in_store: bool = True, **kwargs):
+        """
+        Parameters
+        ----------
+        revalidate: bool
+            guarda el ETag / Last-Modified de la respuesta junto a la entrada
+            y cuando caduca la pide con If-None-Match / If-Modified-Since
+            (ver core.revalidation), si el servidor responde 304 se reutiliza
+        compress: str
+            gz o zst para guardar las entradas comprimidas (fichero.html.gz),
+            las que ya existan sin comprimir (o con otra compresión) se siguen leyendo
+        in_store: bool
+            False para guardar las entradas en disco aunque CACHE_STORE esté definido
+            (las que se publican, como rec/eventos.json, que deploy.yml copia a out/)
+        """
+        if compress not in (None, ) + COMPRESSED:
+            raise ValueError(f"compress={compress} no soportado")
+        if compress == "zst" and zstandard is None:
+            logger.warning("zstandard no está instalado, se usará gz")
+            compress = "gz"
         self.file = file
+        self.stats = get_stats(file)
+        self.revalidate = revalidate
+        self.compress = compress
+        self.in_store = in_store
         self.func = None
         self.reload = reload
         self.maxOld = maxOld
@@ -32,21 +65,75 @@ class Cache:
     def save(self, file, data, *args, **kwargs):
         if file is None:
             return
-        FM.dump(file, data, **self._kwargs)
+        CACHE_MEMORY.discard(FM.resolve_path(file))
+        if FM.store is not None and self.in_store:
+            blob = FM.dumps(data, FM.get_ext(file), **self._kwargs)
+            FM.store.put(FM.get_key(file), blob, FM.get_content_type(file))
+            self.stats.add(bytes_written=len(blob))
+            return
+        if FM.store is not None:
+            # que no tape al fichero una entrada de una ejecución anterior
+            FM.store.delete(FM.get_key(file))
+        target = FM.compressed(file, self.compress)
+        FM.dump(target, data, **self._kwargs)
+        self.stats.add(bytes_written=target.stat().st_size)
+        for cmp in (None, ) + COMPRESSED:
+            path = FM.compressed(file, cmp)
+            if path != target and path.exists():
+                path.unlink()
 
-    def tooOld(self, fl):
+    def find(self, fl):
+        """
+        Ruta del fichero donde está guardada la entrada fl
+        (con la compresión de esta caché o cualquier otra)
+        """
         if fl is None:
-            return True
-        if not os.path.isfile(fl):
+            return None
+        return FM.find(FM.compressed(fl, self.compress))
+
+    def stat(self, fl):
+        if fl is None:
+            return None
+        return FM.stat(fl, self.compress)
+
+    def tooOld(self, fl, st: os.stat_result = None):
+        if st is None:
+            st = self.stat(fl)
+        if st is None:
             return True
         if self.reload:
             return True
         if self.maxOld is None:
             return False
-        if os.stat(fl).st_mtime < self.maxOld:
+        if st.st_mtime < self.maxOld:
             return True
         return False
 
+    def memo_read(self, fl, st: os.stat_result, *args, **kwargs):
+        """
+        Lee fl pasando por CACHE_MEMORY, donde se guarda con la clave
+        (ruta, mtime, tamaño) para no volver a leer el fichero si no ha cambiado
+        """
+        if not self.memory:
+            return self.__read(fl, st, *args, **kwargs)
+        key = (FM.resolve_path(fl), st.st_mtime_ns, st.st_size)
+        data = CACHE_MEMORY.get(key)
+        if data is not None:
+            self.stats.add(memory_hits=1)
+            return data
+        data = self.__read(fl, st, *args, **kwargs)
+        if data is not None:
+            CACHE_MEMORY.put(key, data, estimate_size(data, st.st_size))
+        return data
+
+    def __read(self, fl, st: os.stat_result, *args, **kwargs):
+        ini = time.perf_counter()
+        data = self.read(fl, *args, **kwargs)
+        self.stats.observe("load", time.perf_counter() - ini)
+        if data is not None:
+            self.stats.add(bytes_read=st.st_size)
+        return data
+
     def log(self, txt):
         if self.loglevel is not None:
             logger.log(self.loglevel, txt)
@@ -56,17 +143,91 @@ class Cache:
         if isinstance(self.kwself, str):
             flkwargs[self.kwself] = slf
         fl = self.parse_file_name(*args, **flkwargs)
-        if not self.tooOld(fl):
+        return self._call(fl, functools.partial(self.func, slf, *args, **kwargs), *args, **kwargs)
+
+    def _call(self, fl, func, *args, **kwargs):
+        st = self.stat(fl)
+        if not self.tooOld(fl, st=st):
             self.log(f"Cache.read({fl})")
-            data = self.read(fl, *args, **kwargs)
+            data = self.memo_read(fl, st, *args, **kwargs)
             if data is not None:
+                self.stats.add(hits=1)
                 return data
-        data = self.func(slf, *args, **kwargs)
+        elif st is not None:
+            self.stats.add(stale=1)
+        if self.revalidate:
+            return self.__revalidate(fl, st, func, *args, **kwargs)
+        data = self.__compute(func)
         if data is not None:
             self.log(f"Cache.save({fl})")
             self.save(fl, data, *args, **kwargs)
         return data
 
+    def __revalidate(self, fl, st: os.stat_result, func, *args, **kwargs):
+        validators = None
+        if st is not None and not self.reload:
+            validators = self.read_validators(fl)
+        with revalidation(validators) as rv:
+            try:
+                data = self.__compute(func)
+            except NotModified:
+                data = self.touch(fl, *args, **kwargs)
+                if data is not None:
+                    self.stats.add(not_modified=1)
+                    return data
+                rv.validators = {}
+                data = self.__compute(func)
+        if data is not None:
+            self.log(f"Cache.save({fl})")
+            self.save(fl, data, *args, **kwargs)
+            self.save_validators(fl, rv.last)
+        return data
+
+    def __compute(self, func):
+        ini = time.perf_counter()
+        try:
+            return func()
+        finally:
+            self.stats.observe("compute", time.perf_counter() - ini)
+            self.stats.add(misses=1)
+
+    def touch(self, fl, *args, **kwargs):
+        """
+        La entrada no ha cambiado en el servidor: se renueva su fecha y se lee
+        """
+        self.log(f"Cache.touch({fl})")
+        if FM.store is not None and FM.store.stat(FM.get_key(fl)) is not None:
+            FM.store.touch(FM.get_key(fl))
+        else:
+            os.utime(self.find(fl))
+        st = self.stat(fl)
+        if st is None:
+            return None
+        return self.memo_read(fl, st, *args, **kwargs)
+
+    def get_validators_file(self, fl):
+        path = FM.resolve_path(fl)
+        return path.parent.joinpath(".headers", path.name + ".json")
+
+    def read_validators(self, fl):
+        file = self.get_validators_file(fl)
+        if not FM.exists(file):
+            return None
+        return FM.load(file)
+
+    def save_validators(self, fl, validators):
+        file = self.get_validators_file(fl)
+        if FM.store is not None:
+            if validators is not None:
+                FM.store.put(FM.get_key(file), FM.dumps(validators, "json"), "application/json")
+            else:
+                FM.store.delete(FM.get_key(file))
+            return
+        if validators is not None:
+            FM.dump(file, validators)
+        elif file.is_file():
+            file.unlink()
+
     def __call__(self, func):
         if self.skip:
             return func
@@ -81,18 +242,8 @@ class Cache:
 
 class StaticCache(Cache):
     def callCache(self, *args, **kwargs):
-        flkwargs = dict(kwargs)
-        fl = self.parse_file_name(*args, **flkwargs)
-        if not self.tooOld(fl):
-            self.log(f"Cache.read({fl})")
-            data = self.read(fl, *args, **kwargs)
-            if data is not None:
-                return data
-        data = self.func(*args, **kwargs)
-        if data is not None:
-            self.log(f"Cache.save({fl})")
-            self.save(fl, data, *args, **kwargs)
-        return data
+        fl = self.parse_file_name(*args, **kwargs)
+        return self._call(fl, functools.partial(self.func, *args, **kwargs), *args, **kwargs)
 
     def parse_file_name(self, *args, **kwargs):
         if args or kwargs:
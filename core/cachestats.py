@@ -0,0 +1,151 @@
+import bisect
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from .filemanager import FM
+
+# límites (en segundos) de los histogramas de latencia
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum = self.sum + value
+        self.count = self.count + 1
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum = self.sum + other.sum
+        self.count = self.count + other.count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        arr = []
+        acc = 0
+        for le, c in zip(self.buckets + ("+Inf", ), self.counts):
+            acc = acc + c
+            arr.append((str(le), acc))
+        return arr
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            sum=round(self.sum, 6),
+            buckets=dict(self.cumulative())
+        )
+
+
+class CacheStats:
+    """
+    Contadores de una Cache:
+        hits: entradas leídas (memory_hits de ellas sin tocar el disco)
+        misses: llamadas a la función (stale de ellas porque la entrada estaba caducada)
+        not_modified: entradas caducadas que el servidor confirmó con un 304
+        bytes_read / bytes_written: tamaño de lo leído y escrito
+        load / compute: latencia de leer la entrada o de calcularla
+    """
+    COUNTERS = ("hits", "memory_hits", "misses", "stale", "not_modified", "bytes_read", "bytes_written")
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.__lock = Lock()
+        for c in CacheStats.COUNTERS:
+            setattr(self, c, 0)
+        self.load = Histogram()
+        self.compute = Histogram()
+
+    def add(self, **kwargs: int):
+        with self.__lock:
+            for k, v in kwargs.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def observe(self, name: str, seconds: float):
+        with self.__lock:
+            getattr(self, name).observe(seconds)
+
+    def merge(self, other: "CacheStats"):
+        with self.__lock:
+            for c in CacheStats.COUNTERS:
+                setattr(self, c, getattr(self, c) + getattr(other, c))
+            self.load.merge(other.load)
+            self.compute.merge(other.compute)
+
+    def to_dict(self):
+        return {
+            **{c: getattr(self, c) for c in CacheStats.COUNTERS},
+            "load": self.load.to_dict(),
+            "compute": self.compute.to_dict()
+        }
+
+
+REGISTRY: List[CacheStats] = []
+
+
+def get_stats(pattern: str):
+    stats = CacheStats(pattern)
+    REGISTRY.append(stats)
+    return stats
+
+
+def get_report() -> Dict[str, Dict]:
+    """
+    Estadísticas de todas las Cache del proceso agrupadas por patrón de fichero
+    """
+    merged: Dict[str, CacheStats] = {}
+    for s in REGISTRY:
+        if s.pattern not in merged:
+            merged[s.pattern] = CacheStats(s.pattern)
+        merged[s.pattern].merge(s)
+    return {k: v.to_dict() for k, v in sorted(merged.items())}
+
+
+def get_labels(**labels):
+    """
+    Etiquetas en formato Prometheus: {k1="v1",k2="v2"}
+    """
+    txt = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels.items()
+    )
+    return "{" + txt + "}"
+
+
+def _label(pattern: str, **kwargs):
+    return get_labels(pattern=pattern, **kwargs)
+
+
+def to_prometheus(report: Dict[str, Dict]) -> str:
+    lines = []
+    for c in CacheStats.COUNTERS:
+        name = f"cache_{c}_total"
+        lines.append(f"# TYPE {name} counter")
+        for pattern, js in report.items():
+            lines.append(f"{name}{_label(pattern)} {js[c]}")
+    for h in ("load", "compute"):
+        name = f"cache_{h}_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for pattern, js in report.items():
+            for le, count in js[h]['buckets'].items():
+                lines.append(f"{name}_bucket{_label(pattern, le=le)} {count}")
+            lines.append(f"{name}_sum{_label(pattern)} {js[h]['sum']}")
+            lines.append(f"{name}_count{_label(pattern)} {js[h]['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def dump_report(file: str = None, prom: str = None, extra: Tuple[str] = tuple()):
+    """
+    Guarda get_report en file (json) y en prom (formato Prometheus,
+    seguido de las métricas ya formateadas de extra)
+    """
+    report = get_report()
+    if file:
+        FM.dump(file, report)
+    if prom:
+        FM.dump(prom, to_prometheus(report) + "".join(extra))
+    return report
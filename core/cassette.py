@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+from os import environ
+from pathlib import Path
+from threading import get_ident
+from typing import Dict, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .util import scrub_url
+from .transport import build_response
+
+logger = logging.getLogger(__name__)
+
+re_token = re.compile(rb"\btoken=\w+")
+# cabeceras de la respuesta que no se guardan
+SKIP_HEADERS = ("set-cookie", "content-length", "content-encoding", "transfer-encoding", "connection")
+
+
+def get_body(request: requests.PreparedRequest) -> bytes:
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+    return re_token.sub(b"token=***", body)
+
+
+def is_text(headers: Dict[str, str]) -> bool:
+    ctype = (headers.get("Content-Type") or "").lower()
+    return ctype.startswith("text/") or "json" in ctype or "xml" in ctype or "javascript" in ctype
+
+
+def parse_latency(txt: str) -> Union[str, Tuple[float, float], None]:
+    """
+    CASSETTE_LATENCY: recorded (la latencia con la que se grabó),
+    segundos o min:max (segundos al azar entre min y max)
+    """
+    txt = (txt or "").strip().lower()
+    if txt in ("", "0"):
+        return None
+    if txt == "recorded":
+        return txt
+    a, _, b = txt.partition(":")
+    try:
+        a = float(a)
+        b = float(b) if b else a
+    except ValueError:
+        logger.warning(f"CASSETTE_LATENCY={txt} no válido")
+        return None
+    return (a, b)
+
+
+class Cassette:
+    """
+    Pares petición / respuesta guardados en root/{host}/{sha256}.json
+    (y el contenido en {sha256}.body). La clave sale del método, la url
+    y el cuerpo de la petición sin los tokens (ver scrub_url), que tampoco
+    se guardan en la url ni en las respuestas de texto
+    """
+
+    def __init__(self, root: Union[str, Path], latency: Union[str, Tuple[float, float]] = None):
+        """
+        Parameters
+        ----------
+        latency: Union[str, Tuple[float, float]]
+            espera añadida al reproducir cada respuesta (ver parse_latency)
+        """
+        self.root = Path(root)
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+        self.records = 0
+
+    def get_file(self, request: requests.PreparedRequest) -> Path:
+        url = scrub_url(request.url)
+        h = hashlib.sha256()
+        h.update(f"{request.method} {url}\n".encode())
+        h.update(get_body(request))
+        host = urlsplit(request.url).hostname or "_"
+        return self.root.joinpath(host, h.hexdigest() + ".json")
+
+    def record(self, request: requests.PreparedRequest, r: requests.Response, elapsed: float):
+        file = self.get_file(request)
+        # CaseInsensitiveDict para que is_text encuentre content-type lo mande como lo mande
+        # el servidor, y sin tokens (un Location puede llevar ?token=...)
+        headers = CaseInsensitiveDict({
+            k: scrub_url(v) for k, v in r.headers.items() if k.lower() not in SKIP_HEADERS
+        })
+        content = r.content
+        if is_text(headers):
+            content = re_token.sub(b"token=***", content)
+        meta = dict(
+            method=request.method,
+            url=scrub_url(request.url),
+            status=r.status_code,
+            reason=r.reason,
+            encoding=r.encoding,
+            headers=dict(headers),
+            elapsed=round(elapsed, 4)
+        )
+        file.parent.mkdir(parents=True, exist_ok=True)
+        self.__write(file.with_suffix(".body"), content)
+        self.__write(file, json.dumps(meta, indent=2).encode())
+        self.records = self.records + 1
+
+    def __write(self, file: Path, content: bytes):
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.{get_ident()}.tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, file)
+
+    def replay(self, adapter: BaseAdapter, request: requests.PreparedRequest) -> requests.Response:
+        file = self.get_file(request)
+        if not file.is_file():
+            self.misses = self.misses + 1
+            logger.warning(f"Cassette 404 {request.method} {scrub_url(request.url)}")
+            return build_response(adapter, request, 404, b"")
+        meta = json.loads(file.read_bytes())
+        self.__wait(meta.get('elapsed'))
+        r = build_response(
+            adapter,
+            request,
+            meta['status'],
+            file.with_suffix(".body").read_bytes(),
+            meta['headers'],
+            reason=meta.get('reason')
+        )
+        r.encoding = meta.get('encoding')
+        self.hits = self.hits + 1
+        return r
+
+    def __wait(self, elapsed: float):
+        if self.latency is None:
+            return
+        if self.latency == "recorded":
+            delay = elapsed or 0
+        else:
+            delay = random.uniform(*self.latency)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RecordAdapter(BaseAdapter):
+    """
+    Hace la petición con el adapter de verdad y guarda el par en el Cassette
+    """
+
+    def __init__(self, cassette: Cassette, adapter: BaseAdapter):
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request: requests.PreparedRequest, **kwargs):
+        ini = time.perf_counter()
+        r = self.adapter.send(request, **kwargs)
+        self.cassette.record(request, r, time.perf_counter() - ini)
+        return r
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Responde con lo guardado en el Cassette sin salir a la red
+    """
+
+    def __init__(self, cassette: Cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def send(self, request: requests.PreparedRequest, **kwargs):
+        return self.cassette.replay(self, request)
+
+    def close(self):
+        pass
+
+
+def install(mode: str, root: Union[str, Path] = None, latency: str = None) -> Cassette:
+    """
+    Hace que todas las requests.Session (y requests.get) graben (mode=record)
+    o reproduzcan (mode=replay) sus peticiones en root
+    (por defecto CASSETTE_DIR o cassette/) con la latencia CASSETTE_LATENCY
+    """
+    if mode not in ("record", "replay"):
+        raise ValueError(f"CASSETTE={mode} no soportado (record o replay)")
+    root = root or environ.get("CASSETTE_DIR") or "cassette"
+    cassette = Cassette(root, latency=parse_latency(latency or environ.get("CASSETTE_LATENCY")))
+    if mode == "replay":
+        adapter = ReplayAdapter(cassette)
+
+        def get_adapter(self, url):
+            return adapter
+    else:
+        ori = requests.Session.get_adapter
+
+        def get_adapter(self, url):
+            return RecordAdapter(cassette, ori(self, url))
+
+    requests.Session.get_adapter = get_adapter
+    logger.info(f"Cassette en {root} ({mode})")
+    return cassette
@@ -0,0 +1,282 @@
+import re
+from typing import NamedTuple, Tuple, Dict, Union, Callable, Optional
+
+from .util import plain_text, re_or, re_and
+
+CABADRAG = "cabaret / drag"
+HUMOR = "humor / impro"
+MUSICA = "musica / danza"
+EXPOMUS = "exposición / museo"
+
+Pattern = Union[str, Tuple["Pattern", ...]]
+
+
+class CategoryFields(NamedTuple):
+    """Textos (ya normalizados con plain_text) sobre los que se evalúan las reglas"""
+    path: str
+    cat: int
+    name: str
+    info: Union[str, None]
+    recinto: str
+    name_info: str
+    name_recinto: str
+
+    @staticmethod
+    def build(url: str, js: Dict, img_txt: str = None):
+        path = url.rstrip("/").split("/")[-1]
+        name = plain_text(js['name'] + " "+(js['sub'] or ""))
+        if img_txt:
+            name = (name + " " + (plain_text(img_txt) or "")).strip()
+        info = plain_text((js['info'] or "")+" "+(js['condicion'] or ""), is_html=True)
+        recinto = plain_text(js['recinto']) or ""
+        return CategoryFields(
+            path=path,
+            cat=js['id_categoria'],
+            name=name,
+            info=info,
+            recinto=recinto,
+            name_info=(name+" "+(info or "")).strip(),
+            name_recinto=name+" "+recinto
+        )
+
+
+def iter_atoms(args: Tuple[Pattern]):
+    for r in args:
+        if isinstance(r, tuple):
+            yield from iter_atoms(r)
+        else:
+            yield r
+
+
+def compile_any(atoms):
+    """
+    Une varias expresiones en una sola alternancia, sirve para descartar
+    de un golpe los textos en los que no puede cumplirse ninguna de ellas
+    """
+    atoms = tuple(dict.fromkeys(atoms))
+    return re.compile("|".join(r"(?:\b" + r + r"\b)" for r in atoms))
+
+
+class Matcher:
+    """
+    Versión precompilada de re_or (op='or') y re_and (op='and'):
+    recibe los mismos argumentos y devuelve exactamente lo mismo
+    """
+
+    def __init__(self, op: str, *args: Pattern):
+        self.op = op
+        self.args = args
+        sub_op = "and" if op == "or" else "or"
+        self.items: Tuple[Union[Tuple[str, re.Pattern], Matcher]] = tuple(
+            Matcher(sub_op, *r) if isinstance(r, tuple) else (r, re.compile(r"\b" + r + r"\b"))
+            for r in args
+        )
+        self.any = compile_any(iter_atoms(args))
+
+    def __call__(self, s: str) -> Optional[str]:
+        if s is None or len(s) == 0 or len(self.args) == 0:
+            return None
+        if self.op == "or":
+            if self.any.search(s) is None:
+                return None
+            return self.__or(s)
+        return self.__and(s)
+
+    def __or(self, s: str):
+        for i in self.items:
+            if isinstance(i, Matcher):
+                b = i(s)
+                if b is not None:
+                    return b
+            elif i[1].search(s):
+                return i[0]
+        return None
+
+    def __and(self, s: str):
+        arr = []
+        for i in self.items:
+            if isinstance(i, Matcher):
+                b = i(s)
+                if b is None:
+                    return None
+                arr.append(b)
+            elif i[1].search(s):
+                arr.append(i[0])
+            else:
+                return None
+        return " AND ".join(arr)
+
+
+class Rule(NamedTuple):
+    """
+    Si el campo field de CategoryFields cumple la condición el evento es de categoria
+    op puede ser:
+        'or': re_or(field, *args)
+        'and': re_and(field, *args)
+        'eq': field == args[0]
+    when es una condición adicional que se evalúa antes
+    """
+    categoria: str
+    field: str
+    op: str
+    args: Tuple[Pattern]
+    when: Callable[[CategoryFields], bool] = None
+
+    @staticmethod
+    def any(categoria: str, field: str, *args: Pattern, when=None):
+        return Rule(categoria=categoria, field=field, op="or", args=args, when=when)
+
+    @staticmethod
+    def all(categoria: str, field: str, *args: Pattern, when=None):
+        return Rule(categoria=categoria, field=field, op="and", args=args, when=when)
+
+    @staticmethod
+    def eq(categoria: str, field: str, value: str, when=None):
+        return Rule(categoria=categoria, field=field, op="eq", args=(value,), when=when)
+
+
+class CategoryRules:
+    """
+    Lista ordenada de reglas: gana la primera que se cumple.
+    Las expresiones se compilan una sola vez y además, por cada campo,
+    se compila la alternancia de todas las expresiones que se le aplican
+    para saltarse sin más las reglas de los campos en los que no aparece ninguna
+    """
+
+    def __init__(self, *rules: Rule):
+        self.rules = rules
+        self.matchers = tuple(
+            Matcher(r.op, *r.args) if r.op in ("or", "and") else None
+            for r in rules
+        )
+        atoms: Dict[str, list] = {}
+        for r in rules:
+            if r.op in ("or", "and"):
+                atoms.setdefault(r.field, []).extend(iter_atoms(r.args))
+        self.fields: Dict[str, re.Pattern] = {
+            k: compile_any(v) for k, v in atoms.items()
+        }
+
+    def find(self, f: CategoryFields, compiled: bool = True) -> Tuple[Optional[Rule], Optional[str]]:
+        """
+        Devuelve la primera regla que se cumple y la explicación
+        (lo que devolvería re_or / re_and) o (None, None) si no se cumple ninguna.
+        Con compiled=False se evalúa con re_or / re_and (sirve para comparar)
+        """
+        alive: Dict[str, bool] = {}
+        for rule, matcher in zip(self.rules, self.matchers):
+            if rule.when is not None and not rule.when(f):
+                continue
+            value = getattr(f, rule.field)
+            if rule.op == "eq":
+                if value == rule.args[0]:
+                    return rule, None
+                continue
+            if not compiled:
+                b = (re_or if rule.op == "or" else re_and)(value, *rule.args)
+                if b is not None:
+                    return rule, b
+                continue
+            if rule.field not in alive:
+                alive[rule.field] = bool(value) and self.fields[rule.field].search(value) is not None
+            if not alive[rule.field]:
+                continue
+            b = matcher(value)
+            if b is not None:
+                return rule, b
+        return None, None
+
+
+CATEGORY_RULES = CategoryRules(
+    Rule.eq("otros", "recinto", "wizink center baloncesto"),
+    Rule.any("visita", "name", "visita guiada", "visita libre", "visita a la capital", "audioguia", "tour guiado"),
+    Rule.any("visita", "info", "antes de la hora de salida de la visita"),
+    Rule.any("cine", "name_recinto", "autocine", "cinesa", "cinesur", "yelmo"),
+    Rule.all("cine", "name_recinto", "mk2", ("sesion", "director")),
+    Rule.any("cine", "name_recinto", "mk2", when=lambda f: "eventos" not in f.recinto),
+    Rule.any("cine", "name", "cines"),
+    Rule.any("otros", "info", "jardin botanico"),
+    Rule.any(EXPOMUS, "name", "exposicion", "exposiciones", "museum", "museo"),
+    Rule.eq("otros", "path", "cine-y-eventos"),
+    Rule.any(CABADRAG, "name", "cabaret", "drag", "hole", "burlesque"),
+    Rule.all(CABADRAG, "info", r"gogos?", "erotismo"),
+    Rule.any("magia", "name", "magic", "magia", "magos?", "mentalistas?", "hipnosis"),
+    Rule.any(HUMOR, "name", "impro", "el humor de", "clown"),
+    Rule.any("flamenco", "name", "flamenco", "saeta flamenca"),
+    Rule.any("otros", "name", "bingo", "karaoke", "circo", "parque de atracciones"),
+    Rule.any(MUSICA, "name", r"[jk]-?pop", "cocoloco", "b vocal", "opera", "musica en vivo", "jazz", "tributo", "sinfonico", "musical", "concierto", r"boleros?", "orquesta", "pianista"),
+    Rule.all(MUSICA, "name", r"musical(es)?", "broadway"),
+    Rule.any(HUMOR, "name", "humor", when=lambda f: f.cat == 23),
+    Rule.any("teatro", "info", "monologo narrativo"),
+    Rule.any("magia", "info", "mentalismo", "espectaculo de magia", "espiritismo", "fito crawford"),
+    Rule.all(EXPOMUS, "info", r"exposicion|expondran?", "obras"),
+    # imporate que 'monologos' sea en plural para no confundir con cosas que no son humor
+    Rule.any(
+        HUMOR,
+        "name_info",
+        "stand ?up",
+        "stand-up",
+        "open-mic",
+        "open ?mic",
+        "monologos",
+        "monologuistas",
+        r"impromonologos?",
+        "comedia pura",
+        "show de comedia",
+        "humor blanco",
+        "comedia totalmente improvisada",
+        "improvisacion teatral",
+        "comedy club",
+        "show improvisado",
+        "chic comedy",
+        "humor inteligente",
+        "comico ocasional",
+        "humorista",
+        "presenta su monologo",
+        "un monologo para",
+        "con un monologo que te"
+    ),
+    Rule.any(
+        MUSICA,
+        "info",
+        r"comedias? musical(es)?",
+        r"gran(des)? musical(es)?",
+        "espectaculo musical",
+        "musical integramente cantado",
+        "viaje musical",
+        "concierto",
+        "percusion",
+        "banda sonora",
+        "cantaran sus temas",
+        "album debut"
+    ),
+    Rule.all(HUMOR, "name_info", "clown", "humor"),
+    Rule.any("magia", "info", "mentalista", "prestidigitador", "mentalismo"),
+    Rule.all(HUMOR, "info", ("humor", "humores", "risas"), ("improvisar", "improvisacion", "comicos")),
+    Rule.all(HUMOR, "info", "show", "comicos?"),
+    Rule.any(HUMOR, "name", "el show de"),
+    # importante que vaya al final
+    # porque a veces hace magia u otras cosas
+    Rule.eq(HUMOR, "recinto", "sala de humor fuencarral"),
+    Rule.eq("magia", "recinto", "sala houdini"),
+    Rule.any("teatro", "info", "esta obra puede herir la sensibilidad del espectador"),
+    Rule.any("otros", "info", "podcast", "globoflexia", "lanzamiento de su nuevo libro"),
+    Rule.any(CABADRAG, "info", "cabaret", "drags?"),
+    Rule.any(CABADRAG, "info", "tematica erotica",  "erotismo", when=lambda f: f.cat in (17, 19)),
+)
+
+ID_CATEGORIA = {
+    11: "teatro", # teatro / teatro musical
+    15: "magia", # magia
+    17: "otros", # circo / cabaret
+    18: "otros", # conferencia
+    19: MUSICA, # musica
+    20: "otros", # deporte
+    21: "cine", # cine
+    23: HUMOR, # monologo
+    24: EXPOMUS, # parque tematico / exposicion
+    28: MUSICA, # danza
+    22: MUSICA,
+    25: "otros",
+    30: "otros", # visitas guiadas
+}
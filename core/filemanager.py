@@ -1,17 +1,29 @@
 import json
 import logging
+import os
+import stat
 from os import makedirs
 from os.path import dirname, realpath
 from pathlib import Path
-from functools import cache
 
 import requests
 from bs4 import BeautifulSoup, Tag
 from json.decoder import JSONDecodeError
 from io import BytesIO
+import gzip
+import mimetypes
+from .store import get_store
+from .lru import CACHE_MEMORY, estimate_size
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logger = logging.getLogger(__name__)
 
+COMPRESSED = ("gz", "zst")
+
 
 def myex(e, msg):
     largs = list(e.args)
@@ -42,6 +54,7 @@ class FileManager:
             root = Path(root)
 
         self.root = root
+        self.store = get_store(root)
 
     def resolve_path(self, file) -> Path:
         """
@@ -78,17 +91,93 @@ class FileManager:
             "js": "json",
             "sql": "txt",
             "htm": "html",
-            "ics": "txt"
+            "ics": "txt",
+            "prom": "txt"
         }.get(ext, ext)
 
+    def get_key(self, file) -> str:
+        """
+        Clave de file en el store (su ruta relativa a root)
+        """
+        path = self.resolve_path(file)
+        if path.is_relative_to(self.root):
+            return path.relative_to(self.root).as_posix()
+        return path.as_posix()
+
+    def get_content_type(self, file) -> str:
+        return mimetypes.guess_type("x" + self.get_ext(file))[0] or "application/octet-stream"
+
+    def get_compression(self, file) -> str:
+        """
+        Devuelve gz o zst si el fichero está comprimido (según su extensión)
+        """
+        cmp = Path(file).suffix.lstrip(".").lower()
+        if cmp in COMPRESSED:
+            return cmp
+        return None
+
+    def get_ext(self, file) -> str:
+        """
+        Extensión del fichero sin tener en cuenta la de compresión (a.html.gz -> .html)
+        """
+        file = Path(file)
+        if self.get_compression(file):
+            file = file.with_suffix('')
+        return file.suffix
+
+    def compressed(self, file, cmp: str = None) -> Path:
+        """
+        Ruta de la variante de file comprimida con cmp (o sin comprimir si cmp es None)
+        """
+        file = self.resolve_path(file)
+        if self.get_compression(file):
+            file = file.with_suffix('')
+        if cmp is None:
+            return file
+        return file.with_name(file.name + "." + cmp)
+
+    def find(self, file) -> Path:
+        """
+        Devuelve la ruta de file o, si no existe, la de su variante
+        comprimida (o sin comprimir) que exista
+        """
+        file = self.resolve_path(file)
+        if file.exists():
+            return file
+        for cmp in (None, ) + COMPRESSED:
+            path = self.compressed(file, cmp)
+            if path.exists():
+                return path
+        return None
+
+    def _open(self, file, mode="r"):
+        """
+        Abre el fichero comprimiendo o descomprimiendo según su extensión
+        """
+        cmp = self.get_compression(file)
+        if cmp is None:
+            return open(file, mode)
+        if "b" not in mode:
+            mode = mode + "t"
+        if cmp == "gz":
+            return gzip.open(file, mode)
+        if zstandard is None:
+            raise Exception(f"Se necesita zstandard para {file}")
+        return zstandard.open(file, mode)
+
     def load(self, file, *args, **kwargs):
         """
         Lee un fichero en funcion de su extension
         Para que haya soporte para esa extension ha de exisitir una funcion load_extension
+        Si no existe se lee su variante comprimida (o sin comprimir)
         """
-        file = self.resolve_path(file)
+        ext = self.normalize_ext(self.get_ext(file))
+        if self.store is not None:
+            blob = self.store.get(self.get_key(file))
+            if blob is not None:
+                return self.loads(blob, ext, *args, **kwargs)
 
-        ext = self.normalize_ext(file.suffix)
+        file = self.find(file) or self.resolve_path(file)
 
         load_fl = getattr(self, "load_"+ext, None)
         if load_fl is None:
@@ -97,13 +186,90 @@ class FileManager:
 
         return load_fl(file, *args, **kwargs)
 
-    @cache
     def cached_load(self, file, *args, **kwargs):
-        return self.load(file, *args, **kwargs)
+        """
+        Como load pero guardando el resultado en CACHE_MEMORY (acotada por
+        CACHE_MEMORY_MB, ver core.lru) con la clave (ruta, mtime, tamaño),
+        de manera que si el fichero cambia se vuelve a leer.
+        Es la misma memoria que usa Cache, así que comparten lo ya leído
+        """
+        st = self.stat(file)
+        if st is None:
+            return self.load(file, *args, **kwargs)
+        key = (self.resolve_path(file), st.st_mtime_ns, st.st_size)
+        if args or kwargs:
+            key = key + (args, tuple(sorted(kwargs.items())))
+        data = CACHE_MEMORY.get(key)
+        if data is None:
+            data = self.load(file, *args, **kwargs)
+            if data is not None:
+                CACHE_MEMORY.put(key, data, estimate_size(data, st.st_size))
+        return data
+
+    def stat(self, file, cmp: str = None):
+        """
+        os.stat del fichero (o de su entrada en el store o de su variante comprimida,
+        empezando por la comprimida con cmp) o None si no existe
+        """
+        if self.store is not None:
+            st = self.store.stat(self.get_key(file))
+            if st is not None:
+                return st
+        path = self.find(self.compressed(file, cmp))
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return st
 
     def exists(self, file):
-        file = self.resolve_path(file)
-        return file.exists()
+        if self.store is not None and self.store.stat(self.get_key(file)) is not None:
+            return True
+        return self.find(file) is not None
+
+    def read_bytes(self, file) -> bytes:
+        """
+        Contenido (descomprimido) de file, del store o del disco, o None si no existe
+        """
+        if self.store is not None:
+            blob = self.store.get(self.get_key(file))
+            if blob is not None:
+                return blob
+        path = self.find(file)
+        if path is None or not path.is_file():
+            return None
+        with self._open(path, "rb") as f:
+            return f.read()
+
+    def loads(self, content: bytes, ext: str, *args, **kwargs):
+        """
+        Como load pero a partir del contenido del fichero
+        Para que haya soporte para esa extension ha de exisitir una funcion loads_extension
+        """
+        ext = self.normalize_ext(ext)
+        loads_fl = getattr(self, "loads_"+ext, None)
+        if loads_fl is None:
+            raise Exception("No existe metodo para leer contenido {}".format(ext))
+        return loads_fl(content, *args, **kwargs)
+
+    def dumps(self, obj, ext: str, *args, **kwargs) -> bytes:
+        """
+        Como dump pero devolviendo el contenido del fichero
+        Para que haya soporte para esa extension ha de exisitir una funcion dumps_extension
+        """
+        if isinstance(obj, BytesIO):
+            return obj.getvalue()
+        if isinstance(obj, bytes):
+            return obj
+        ext = self.normalize_ext(ext)
+        dumps_fl = getattr(self, "dumps_"+ext, None)
+        if dumps_fl is None:
+            raise Exception("No existe metodo para guardar contenido {}".format(ext))
+        return dumps_fl(obj, *args, **kwargs)
 
     def dump(self, file, obj, *args, **kwargs):
         """
@@ -113,14 +279,14 @@ class FileManager:
         file = self.resolve_path(file)
         makedirs(file.parent, exist_ok=True)
 
-        ext = self.normalize_ext(file.suffix)
+        ext = self.normalize_ext(self.get_ext(file))
 
         if isinstance(obj, BytesIO):
-            with open(file, "wb") as f:
+            with self._open(file, "wb") as f:
                 f.write(obj.getvalue())
             return
         if isinstance(obj, bytes):
-            with open(file, "wb") as f:
+            with self._open(file, "wb") as f:
                 f.write(obj)
             return
 
@@ -152,28 +318,53 @@ class FileManager:
                 f.write(r.content)
 
     def load_json(self, file, *args, **kwargs):
-        with open(file, "r") as f:
+        with self._open(file, "r") as f:
             try:
                 return json.load(f, *args, **kwargs)
             except JSONDecodeError as e:
                 raise myex(e, str(file))
 
     def dump_json(self, file, obj, *args, indent=2, **kwargs):
-        with open(file, "w") as f:
+        with self._open(file, "w") as f:
             json.dump(obj, f, *args, indent=indent, **kwargs)
 
+    def loads_json(self, content: bytes, *args, **kwargs):
+        return json.loads(content.decode(), *args, **kwargs)
+
+    def dumps_json(self, obj, *args, indent=2, **kwargs):
+        return json.dumps(obj, *args, indent=indent, **kwargs).encode()
+
     def load_html(self, file, *args, parser="lxml", **kwargs):
-        with open(file, "r") as f:
+        with self._open(file, "r") as f:
             return BeautifulSoup(f.read(), parser)
 
     def dump_html(self, file, obj, *args, **kwargs):
         if isinstance(obj, (BeautifulSoup, Tag)):
             obj = str(obj)
-        with open(file, "w") as f:
+        with self._open(file, "w") as f:
             f.write(obj)
 
+    def loads_html(self, content: bytes, *args, parser="lxml", **kwargs):
+        return BeautifulSoup(content.decode(), parser)
+
+    def dumps_html(self, obj, *args, **kwargs):
+        if isinstance(obj, (BeautifulSoup, Tag)):
+            obj = str(obj)
+        return obj.encode()
+
+    def loads_txt(self, content: bytes, *args, **kwargs):
+        txt = content.decode()
+        if args or kwargs:
+            txt = txt.format(*args, **kwargs)
+        return txt
+
+    def dumps_txt(self, txt, *args, **kwargs):
+        if args or kwargs:
+            txt = txt.format(*args, **kwargs)
+        return txt.encode()
+
     def load_txt(self, file, *args, **kwargs):
-        with open(file, "r") as f:
+        with self._open(file, "r") as f:
             txt = f.read()
             if args or kwargs:
                 txt = txt.format(*args, **kwargs)
@@ -182,7 +373,7 @@ class FileManager:
     def dump_txt(self, file, txt, *args, **kwargs):
         if args or kwargs:
             txt = txt.format(*args, **kwargs)
-        with open(file, "w") as f:
+        with self._open(file, "w") as f:
             f.write(txt)
 
 
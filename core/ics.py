@@ -4,8 +4,14 @@ import pytz
 from dataclasses import dataclass, asdict
 import uuid
 import re
+import hashlib
+import logging
+from os import makedirs
+from functools import cached_property
 from .filemanager import FM
-from typing import Union
+from typing import Union, Dict, List
+
+logger = logging.getLogger(__name__)
 
 UUID_NAMESPACE = uuid.UUID('00000000-0000-0000-0000-000000000000')
 
@@ -19,6 +25,9 @@ ICS_BEGIN = dedent(
 
 ICS_END = "END:VCALENDAR"
 
+re_newline = re.compile(r"[\r\n]+")
+re_dtstamp = re.compile(r"^DTSTAMP:.*$", re.MULTILINE)
+
 
 @dataclass(frozen=True)
 class IcsEvent:
@@ -88,12 +97,65 @@ class IcsEvent:
     def key_order(self):
         return (self.dtstart, self.dtend, self.uid)
 
+    @cached_property
+    def text(self):
+        return re_newline.sub("\r\n", str(self))
+
+    @staticmethod
+    def to_ics(*events: "IcsEvent"):
+        lines = [re_newline.sub("\r\n", ICS_BEGIN)]
+        lines.extend(e.text for e in sorted(events))
+        lines.append(ICS_END)
+        return "\r\n".join(lines)
+
     @staticmethod
     def dump(path, *events: "IcsEvent"):
-        events = sorted(events)
-        ics = ICS_BEGIN+"\n"+("\n".join(map(str, events)))+"\n"+ICS_END
-        ics = re.sub(r"[\r\n]+", r"\r\n", ics)
-        FM.dump(path, ics)
+        FM.dump(path, IcsEvent.to_ics(*events))
 
     def dumpme(self, path):
         IcsEvent.dump(path, self)
+
+
+def get_ics_hash(ics: str):
+    """Hash del calendario sin tener en cuenta DTSTAMP (que cambia en cada ejecución)"""
+    return hashlib.sha256(re_dtstamp.sub("", ics).encode()).hexdigest()
+
+
+class IcsWriter:
+    """
+    Acumula los calendarios a generar para escribirlos todos de una vez.
+    Cada evento se serializa una sola vez aunque aparezca en varios calendarios
+    y solo se escriben los ficheros cuyo contenido ha cambiado
+    """
+
+    def __init__(self, force: bool = False):
+        self.force = force
+        self.__calendars: Dict[str, List[IcsEvent]] = {}
+
+    def add(self, path: str, *events: IcsEvent):
+        if path not in self.__calendars:
+            self.__calendars[path] = []
+        self.__calendars[path].extend(events)
+
+    def __is_changed(self, file, ics: str):
+        if self.force or not file.is_file():
+            return True
+        with open(file, "r", newline="") as f:
+            old = f.read()
+        return get_ics_hash(old) != get_ics_hash(ics)
+
+    def write(self):
+        dirs = set()
+        count = 0
+        for path, events in self.__calendars.items():
+            file = FM.resolve_path(path)
+            ics = IcsEvent.to_ics(*events)
+            if not self.__is_changed(file, ics):
+                continue
+            if file.parent not in dirs:
+                makedirs(file.parent, exist_ok=True)
+                dirs.add(file.parent)
+            with open(file, "w") as f:
+                f.write(ics)
+            count = count + 1
+        logger.info(f"{count} ics actualizados de {len(self.__calendars)}")
@@ -1,5 +1,4 @@
 from PIL import Image, UnidentifiedImageError, ImageChops
-import requests
 from io import BytesIO
 import logging
 from os.path import dirname
@@ -7,34 +6,117 @@ from os import makedirs
 from typing import List, Tuple, NamedTuple, Union, Dict
 from functools import cached_property, cache
 from os.path import isfile
-from pytesseract import image_to_string
+from pytesseract import image_to_string, get_tesseract_version
+import os
+import json
+import hashlib
+import shutil
 import time
+from threading import get_ident
 from requests.exceptions import RequestException, ConnectionError
 from urllib3.exceptions import NewConnectionError
 from core.cache import Cache
 from core.filemanager import FM
+from core.lru import CACHE_MEMORY
+from core.blob import POSTERS
+from core.ratelimit import RATE_LIMITER
+from core.transport import new_session
 from os import environ
+import math
 
 logger = logging.getLogger(__name__)
+WHITE = (255, 255, 255)
 
 
-class BytesIOCache(Cache):
+class PosterCache(Cache):
+    """
+    Guarda en {file}{host}/{path}.txt el sha256 del contenido descargado
+    de la url, que está en POSTERS
+    """
+
     def parse_file_name(self, url: str, slf=None, **kwargs):
         path = url.split("://", 1)[-1]
-        return self.file+path
+        return self.file+path+".txt"
 
     def read(self, file, *args, **kwargs):
-        path = FM.resolve_path(file)
-        if not path.exists():
+        return FM.load(file).strip()
+
+    def memo_read(self, fl, st, *args, **kwargs):
+        h = super().memo_read(fl, st, *args, **kwargs)
+        if not POSTERS.exists(h):
             return None
-        with open(path, "rb") as f:
-            content = f.read()
-        return BytesIO(content)
+        return h
+
+
+# miniaturas ya generadas por sha256 del cartel y ancho, compartidas entre procesos (--jobs)
+THUMBNAILS = "rec/thumb/{}_{}"
+
+
+def decode_poster(h: str) -> Union[Image.Image, None]:
+    """
+    Imagen (en RGB) guardada en POSTERS con el sha256 h, decodificada una sola vez
+    (mientras siga en CACHE_MEMORY) aunque la compartan varias urls.
+    None si no existe o está corrupta
+    """
+    key = (POSTERS.get_file(h), h)
+    im = CACHE_MEMORY.get(key)
+    if im is not None:
+        return im
+    content = POSTERS.get(h)
+    if content is None:
+        return None
+    im = Image.open(BytesIO(content))
+    im = im.convert('RGB')
+    CACHE_MEMORY.put(key, im, im.width * im.height * len(im.getbands()))
+    return im
+
+
+def find_thumbnail(h: str, width: int, file: str) -> Union[Tuple[int, int, int], bool]:
+    """
+    Copia en file la miniatura ya generada (en este u otro proceso) del cartel h
+    y devuelve su color de fondo, o False si no hay
+    """
+    base = FM.resolve_path(THUMBNAILS.format(h, width))
+    meta = base.with_suffix(".json")
+    if not meta.is_file():
+        return False
+    bg = json.loads(meta.read_text()).get('background')
+    dr = dirname(file)
+    if dr:
+        makedirs(dr, exist_ok=True)
+    shutil.copyfile(base.with_suffix(".jpg"), file)
+    return tuple(bg) if bg else None
+
+
+def save_thumbnail(h: str, width: int, file: str, background: Tuple[int, int, int]):
+    """
+    Guarda la miniatura file del cartel h para que find_thumbnail la reutilice.
+    El json se escribe el último: si existe la miniatura está completa
+    """
+    base = FM.resolve_path(THUMBNAILS.format(h, width))
+    makedirs(base.parent, exist_ok=True)
+    tmp = f".{os.getpid()}.{get_ident()}.tmp"
+    shutil.copyfile(file, base.with_suffix(".jpg" + tmp))
+    os.replace(base.with_suffix(".jpg" + tmp), base.with_suffix(".jpg"))
+    base.with_suffix(".json" + tmp).write_text(json.dumps(dict(background=background)))
+    os.replace(base.with_suffix(".json" + tmp), base.with_suffix(".json"))
+
+
+class OcrCache(Cache):
+    def parse_file_name(self, *args, slf: "MyImage" = None, **kwargs):
+        return self.file.format(slf.ocr_key)
+
+
+@cache
+def tesseract_version():
+    return str(get_tesseract_version())
 
 
 def get_webarchive(url):
     api_url = f"https://archive.org/wayback/available?url={url}"
-    r = requests.get(api_url)
+    RATE_LIMITER(api_url)
+    with new_session() as s:
+        r = s.get(api_url)
     if r.status_code != 200:
         return None
     data = r.json()
@@ -47,12 +129,16 @@ def get_webarchive(url):
             return new_url
 
     save_url = f"https://web.archive.org/save/{url}"
-    r = requests.get(save_url)
+    RATE_LIMITER(save_url)
+    with new_session() as s:
+        r = s.get(save_url)
     return None
 
 
 def get_bytes(url: str):
-    response = requests.get(url)
+    RATE_LIMITER(url)
+    with new_session() as s:
+        response = s.get(url)
     return BytesIO(response.content)
 
 
@@ -76,6 +162,8 @@ class CornerColor(NamedTuple):
 
 
 class MyImage:
+    OCR_LANG = "spa"
+
     def __init__(self, image: Union[str, Image.Image], parent: Image.Image = None, background: Tuple[int, int, int]=None):
         self.__path_or_image = image
         self.__url = None
@@ -129,10 +217,14 @@ class MyImage:
             return self.__path_or_image
         try:
             path = str(self.path)
-            if not isfile(path):
-                path = self.__get_from_url_using_webarchive(path)
-            im = Image.open(path)
-            im = im.convert('RGB')
+            if isfile(path):
+                im = Image.open(path)
+                return im.convert('RGB')
+            im = decode_poster(self.blob)
+            if im is None:
+                # el contenido guardado estaba corrupto: se vuelve a descargar
+                del self.blob
+                im = decode_poster(self.blob)
             return im
         except (RequestException, NewConnectionError, ConnectionError):
             logger.critical(f"No se pudo descargar la imagen {self.path}", exc_info=True)
@@ -140,7 +232,20 @@ class MyImage:
             logger.critical(f"La ruta no apunta a una imagen válida {self.path}", exc_info=True)
         return None
 
-    @BytesIOCache("rec/img/")
+    @cached_property
+    def blob(self) -> Union[str, None]:
+        """
+        sha256 del contenido de la url (ver POSTERS) o None si es un fichero local
+        """
+        if not isinstance(self.__path_or_image, str) or isfile(self.__path_or_image):
+            return None
+        return self.__get_poster(self.__path_or_image)
+
+    @PosterCache("rec/img/")
+    def __get_poster(self, url: str):
+        b = self.__get_from_url_using_webarchive(url)
+        return POSTERS.put(b.getvalue())
+
     def __get_from_url_using_webarchive(self, url: str, tries=3):
         if environ['IS_ANON'] == "true":
             return get_bytes(url)
@@ -271,8 +376,104 @@ class MyImage:
             p = p.parent
         return p
 
+    @property
+    def ocr_key(self):
+        """
+        Hash del contenido de la imagen, la versión de tesseract y el idioma
+        con el que se guarda el resultado del OCR en rec/ocr/
+        """
+        im = self.im
+        h = hashlib.sha256()
+        h.update(f"{MyImage.OCR_LANG} {tesseract_version()} {im.mode} {im.size}\n".encode())
+        h.update(im.tobytes())
+        return h.hexdigest()
+
     @cached_property
     def txt(self):
         if self.isKO:
             return None
-        return image_to_string(self.im, lang="spa")
+        return self.__ocr()
+
+    @OcrCache("rec/ocr/{}.txt", kwself="slf", maxOld=None)
+    def __ocr(self):
+        return image_to_string(self.im, lang=MyImage.OCR_LANG)
+
+
+def distance_to_white(*color) -> Tuple[int]:
+    arr = []
+    for c in color:
+        d = math.sqrt(sum([(c1 - c2) ** 2 for c1, c2 in zip(c, WHITE)]))
+        arr.append(d)
+    return tuple(arr)
+
+
+def get_trim_image(im: MyImage):
+    tr = im.trim()
+    if tr is None or tr.isKO:
+        return None
+    if (im.isLandscape and tr.isPortrait):
+        return tr
+    if len(set(im.im.size).intersection(tr.im.size)) == 1:
+        return tr
+    diff_height = abs(im.im.height-tr.im.height)
+    diff_width = abs(im.im.width-tr.im.width)
+    if diff_height < (im.im.height*0.10) and diff_width > (im.im.width*0.20):
+        return tr
+    if diff_width < (im.im.width*0.10) and diff_height > (im.im.height*0.20):
+        return tr
+    dist = distance_to_white(im.get_corner_colors().get_most_common())
+    if max(dist) < 260:
+        return tr
+    return None
+
+
+def get_thumbnail(url: str, file: str, width: int = 500):
+    """
+    Devuelve la miniatura de url guardada en file (generándola si no existe).
+    Si no se puede generar devuelve la mejor imagen disponible, que no
+    tendrá file como path
+    """
+    im = MyImage.get(url)
+    if isfile(file):
+        return MyImage(file, parent=im, background=im.background)
+    if im.isKO:
+        return im
+    # después de recortar im ya no es una url y no tiene blob
+    h = im.blob
+    if h is not None:
+        bg = find_thumbnail(h, width, file)
+        if bg is not False:
+            # el mismo cartel con otra url: se reutiliza su miniatura
+            return MyImage(file, parent=im, background=bg)
+    height = [im.im.height, 300, width*(9/16)]
+    im = get_trim_image(im) or im
+    tb = im.thumbnail(width=width, height=min(height))
+    if tb is None or tb.isKO:
+        return im
+    lc = tb.save(file, quality=80)
+    if lc is None or lc.isKO:
+        return im
+    if h is not None:
+        save_thumbnail(h, width, file, lc.background)
+    return lc
+
+
+class Thumbnail(NamedTuple):
+    """
+    Resultado de get_thumbnail que puede viajar entre procesos:
+    solo rutas y metadatos, nunca objetos PIL
+    """
+    url: str
+    file: str
+    background: Tuple[int, int, int]
+
+    @staticmethod
+    def build(url: str, file: str, width: int = 500):
+        lc = get_thumbnail(url, file, width=width)
+        if lc.path != file:
+            return None
+        return Thumbnail(url=url, file=file, background=lc.background)
+
+    def to_image(self):
+        parent = MyImage(self.url, background=self.background)
+        return MyImage(self.file, parent=parent, background=self.background)
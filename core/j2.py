@@ -5,12 +5,12 @@ from urllib.parse import quote_plus
 from minify_html import minify
 from unidecode import unidecode
 from _collections_abc import dict_items
-from os.path import relpath, dirname, exists, isfile
+from os.path import relpath, dirname, exists, isfile, getmtime
 from os import environ, makedirs
 from base64 import b64encode
 
 import bs4
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, meta
 
 re_br = re.compile(r"<br/>(\s*</)")
 re_sp = re.compile(r"\s+")
@@ -132,7 +132,7 @@ def get_default_target_links(soup: bs4.Tag):
 
 class Jnj2():
 
-    def __init__(self, origen, destino, favicon=None, pre=None, post=None):
+    def __init__(self, origen, destino, favicon=None, pre=None, post=None, transformers=None):
         self.j2_env = Environment(
             loader=FileSystemLoader(origen), trim_blocks=True)
         self.j2_env.filters['millar'] = millar
@@ -148,6 +148,22 @@ class Jnj2():
         self.lastArgs = None
         self.minify = environ.get("MINIFY") == "1"
         self.favicon = favicon
+        self.transformers = list(transformers or [])
+        self.transformers.append(self.soup_relative)
+        # minify elimina los target="_self" (es el valor por defecto)
+        # así que estas transformaciones tienen que ir después de minify
+        self.minified_transformers = [
+            self.soup_target,
+            self.soup_favicon
+        ]
+
+    def add_transformer(self, transformer):
+        """
+        Añade una transformación que recibe (soup, destino=..., **kwargs)
+        y modifica el html directamente sobre el arbol de BeautifulSoup.
+        Se ejecuta antes de las transformaciones por defecto
+        """
+        self.transformers.insert(len(self.transformers) - 1, transformer)
 
     def get_svg_favicon(self):
         if self.favicon is None:
@@ -177,10 +193,15 @@ class Jnj2():
         destino = self.destino + destino
         directorio = dirname(destino)
 
-        html = self.do_relative(directorio, html)
-        html = self.do_minimity(html)
-        html = self.set_target(html)
-        html = self.add_favicon(html)
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        for transformer in self.transformers:
+            transformer(soup, destino=destino, **kwargs)
+        if self.minify:
+            html = self.do_minimity(str(soup))
+            soup = bs4.BeautifulSoup(html, 'html.parser')
+        for transformer in self.minified_transformers:
+            transformer(soup, destino=destino, **kwargs)
+        html = str(soup)
 
         if not exists(directorio):
             makedirs(directorio)
@@ -190,16 +211,24 @@ class Jnj2():
         return html
 
     def add_favicon(self, html: str):
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        self.soup_favicon(soup)
+        return str(soup)
+
+    def soup_favicon(self, soup: bs4.BeautifulSoup, **kwargs):
         favicon = self.get_svg_favicon()
         if favicon is None:
-            return html
-        soup = bs4.BeautifulSoup(html, 'html.parser')
+            return
         soup.find("head").append(toTag(f'<link rel="icon" href="{favicon}"/>'))
-        return str(soup)
 
     def do_relative(self, directorio: str, html: str):
-        path = "./" + directorio[len(self.destino):].lstrip("/")
         soup = bs4.BeautifulSoup(html, 'html.parser')
+        self.soup_relative(soup, destino=directorio + "/")
+        return str(soup)
+
+    def soup_relative(self, soup: bs4.BeautifulSoup, destino: str, **kwargs):
+        directorio = dirname(destino)
+        path = "./" + directorio[len(self.destino):].lstrip("/")
         n: bs4.Tag
         for n in soup.findAll(["a", "img", "script", "link", "iframe", "frame"]):
             attr = "src"
@@ -213,7 +242,6 @@ class Jnj2():
             if len(link) == 0:
                 link = "./"
             n.attrs[attr] = link
-        return str(soup)
 
     def do_minimity(self, html: str):
         if not self.minify:
@@ -237,6 +265,10 @@ class Jnj2():
 
     def set_target(self, html):
         soup = bs4.BeautifulSoup(html, 'html.parser')
+        self.soup_target(soup)
+        return str(soup)
+
+    def soup_target(self, soup: bs4.BeautifulSoup, **kwargs):
         links = tuple(get_default_target_links(soup))
         re_count = 0
         lc_count = 0
@@ -257,7 +289,6 @@ class Jnj2():
                 a.attrs["target"] = "_self"
             elif "target" in a.attrs:
                 del a.attrs["target"]
-        return str(soup)
 
     def create_script(self, destino, replace=False, **kwargs):
         destino = self.destino + destino
@@ -289,6 +320,17 @@ class Jnj2():
                 f.write(js)
                 f.write(";")
 
+    def get_mtime(self, template: str) -> float:
+        """
+        Fecha de modificación más reciente entre la plantilla y las plantillas que incluye
+        """
+        source, filename, _ = self.j2_env.loader.get_source(self.j2_env, template)
+        mtime = getmtime(filename)
+        for t in meta.find_referenced_templates(self.j2_env.parse(source)):
+            if t is not None:
+                mtime = max(mtime, self.get_mtime(t))
+        return mtime
+
     def exists(self, destino):
         destino = self.destino + destino
         return isfile(destino)
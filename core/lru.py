@@ -0,0 +1,104 @@
+import sys
+import logging
+from collections import OrderedDict
+from os import environ
+from threading import Lock
+from typing import Any, Dict, Hashable, Tuple
+
+from bs4 import Tag
+
+logger = logging.getLogger(__name__)
+
+# memoria aproximada que ocupa lo leído de un fichero en relación a su tamaño
+SOUP_FACTOR = 30
+JSON_FACTOR = 8
+
+
+def get_env_mb(name: str, default: int):
+    v = environ.get(name)
+    if v is None or not v.strip().isdigit():
+        return default * 1024 * 1024
+    return int(v) * 1024 * 1024
+
+
+def estimate_size(obj, file_size: int) -> int:
+    """
+    Estimación (barata) de los bytes de memoria que ocupa obj leído de un fichero de file_size bytes
+    """
+    if isinstance(obj, (str, bytes)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, Tag):
+        return file_size * SOUP_FACTOR
+    if isinstance(obj, (dict, list, tuple)):
+        return file_size * JSON_FACTOR
+    return file_size
+
+
+class LRU:
+    """
+    Diccionario acotado por tamaño (la suma de los size de sus valores)
+    que al llenarse descarta los valores usados hace más tiempo.
+    Las claves son (path, *version) de manera que al cambiar la versión
+    de un path (por ejemplo su mtime) la entrada antigua se descarta
+    """
+
+    def __init__(self, maxsize: int):
+        """
+        Parameters
+        ----------
+        maxsize: int
+            tamaño máximo (0 desactiva el LRU)
+        """
+        self.maxsize = maxsize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__data: OrderedDict[Tuple, Tuple[Any, int]] = OrderedDict()
+        self.__keys: Dict[Hashable, Tuple] = {}
+        self.__lock = Lock()
+
+    def get(self, key: Tuple, default=None):
+        with self.__lock:
+            item = self.__data.get(key)
+            if item is None:
+                self.misses = self.misses + 1
+                return default
+            self.__data.move_to_end(key)
+            self.hits = self.hits + 1
+            return item[0]
+
+    def put(self, key: Tuple, value, size: int):
+        if self.maxsize <= 0 or size > self.maxsize:
+            return
+        with self.__lock:
+            self.__discard(key[0])
+            self.__data[key] = (value, size)
+            self.__keys[key[0]] = key
+            self.size = self.size + size
+            while self.size > self.maxsize:
+                old, (_, old_size) = self.__data.popitem(last=False)
+                del self.__keys[old[0]]
+                self.size = self.size - old_size
+
+    def discard(self, path: Hashable):
+        with self.__lock:
+            self.__discard(path)
+
+    def __discard(self, path: Hashable):
+        key = self.__keys.pop(path, None)
+        if key is not None:
+            _, size = self.__data.pop(key)
+            self.size = self.size - size
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.__keys.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.__data)
+
+
+# Memoria compartida por todas las Cache y FM.cached_load (CACHE_MEMORY_MB=0 la desactiva)
+CACHE_MEMORY = LRU(get_env_mb("CACHE_MEMORY_MB", 64))
@@ -0,0 +1,73 @@
+import json
+import hashlib
+import logging
+from typing import Dict, Union
+
+from .filemanager import FM
+
+logger = logging.getLogger(__name__)
+
+
+def get_hash(*args) -> str:
+    js = json.dumps(args, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(js.encode()).hexdigest()
+
+
+def get_file_hash(file) -> Union[str, None]:
+    """
+    Hash del contenido (descomprimido) del fichero, de su variante comprimida
+    o de su entrada en el store
+    """
+    content = FM.read_bytes(file)
+    if content is None:
+        return None
+    return hashlib.sha256(content).hexdigest()
+
+
+class Manifest:
+    """
+    Guarda el hash de las entradas con las que se generó cada fichero de salida
+    para poder saltarse los que no han cambiado desde la última ejecución
+    """
+
+    def __init__(self, file: str, full: bool = False):
+        """
+        Parameters
+        ----------
+        file: str
+            fichero json donde se guarda el manifiesto
+        full: bool
+            ignora el manifiesto anterior, es decir, se regenera todo
+        """
+        self.file = file
+        self.full = full
+        self.__old: Dict[str, str] = {}
+        self.__new: Dict[str, str] = {}
+        self.skipped = 0
+        if not full and FM.exists(file):
+            self.__old = FM.load(file)
+
+    def is_changed(self, out: str, *inputs):
+        """
+        Registra el hash de inputs para el fichero out y
+        devuelve False si coincide con el de la ejecución anterior y out existe
+        """
+        h = get_hash(*inputs)
+        self.__new[out] = h
+        if self.full or self.__old.get(out) != h or not FM.exists(out):
+            return True
+        self.skipped = self.skipped + 1
+        return False
+
+    def save(self):
+        """
+        Guarda el manifiesto y borra los ficheros de la ejecución anterior
+        que ya no se generan (por ejemplo la página de un evento que ya no está)
+        """
+        logger.info(f"{self.skipped} ficheros sin cambios de {len(self.__new)}")
+        for out in set(self.__old).difference(self.__new):
+            path = FM.resolve_path(out)
+            if path.is_file():
+                logger.info(f"{out} ya no se genera, se borra")
+                path.unlink()
+        FM.dump(self.file, self.__new)
@@ -0,0 +1,80 @@
+import time
+import resource
+import logging
+from typing import Dict, List, Union
+
+from .filemanager import FM
+
+logger = logging.getLogger(__name__)
+
+
+def get_usage():
+    slf = resource.getrusage(resource.RUSAGE_SELF)
+    chl = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return dict(
+        wall=time.perf_counter(),
+        cpu=slf.ru_utime + slf.ru_stime,
+        cpu_children=chl.ru_utime + chl.ru_stime,
+        maxrss=slf.ru_maxrss,
+        maxrss_children=chl.ru_maxrss
+    )
+
+
+class Phases:
+    """
+    Mide el tiempo real, el tiempo de cpu (propio y de los procesos hijos)
+    y el pico de memoria (ru_maxrss en KB) de cada fase de un proceso.
+    Empezar una fase termina la anterior:
+
+        phases.start("eventos")
+        ...
+        phases.start("ics")
+        ...
+        phases.stop()
+    """
+
+    def __init__(self):
+        self.phases: List[Dict[str, Union[str, float, int]]] = []
+        self.__name: str = None
+        self.__ini: Dict[str, float] = None
+        self.__first = get_usage()
+
+    def start(self, name: str):
+        self.stop()
+        self.__name = name
+        self.__ini = get_usage()
+
+    def stop(self):
+        if self.__name is None:
+            return
+        end = get_usage()
+        ini = self.__ini
+        self.phases.append(dict(
+            name=self.__name,
+            wall=round(end['wall'] - ini['wall'], 4),
+            cpu=round(end['cpu'] - ini['cpu'], 4),
+            cpu_children=round(end['cpu_children'] - ini['cpu_children'], 4),
+            maxrss=end['maxrss'],
+            maxrss_children=end['maxrss_children']
+        ))
+        logger.info("{name}: {wall:.2f}s real, {cpu:.2f}s cpu (+{cpu_children:.2f}s hijos)".format(**self.phases[-1]))
+        self.__name = None
+        self.__ini = None
+
+    def total(self):
+        end = get_usage()
+        ini = self.__first
+        return dict(
+            wall=round(end['wall'] - ini['wall'], 4),
+            cpu=round(end['cpu'] - ini['cpu'], 4),
+            cpu_children=round(end['cpu_children'] - ini['cpu_children'], 4),
+            maxrss=end['maxrss'],
+            maxrss_children=end['maxrss_children']
+        )
+
+    def dump(self, file: str):
+        self.stop()
+        FM.dump(file, dict(
+            phases=self.phases,
+            total=self.total()
+        ))
@@ -0,0 +1,74 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Iterable, Tuple
+
+from .cache import Cache
+from .lru import CACHE_MEMORY, estimate_size
+
+logger = logging.getLogger(__name__)
+
+# fracción de CACHE_MEMORY que puede ocupar lo precargado
+PRELOAD_MEMORY = 0.8
+
+
+class Preloader:
+    """
+    Lee con varios hilos entradas de caché que se van a necesitar
+    y las deja en CACHE_MEMORY (con la misma clave que Cache.memo_read)
+    para que al pedirlas no haya que volver a tocar el disco.
+    Deja de precargar cuando lo leído ocuparía más de PRELOAD_MEMORY
+    de CACHE_MEMORY, para no expulsar lo que se precargó antes
+    """
+
+    def __init__(self, workers: int = 4):
+        """
+        Parameters
+        ----------
+        workers: int
+            hilos con los que se leen las entradas
+        """
+        self.workers = workers
+        self.size = 0
+        self.count = 0
+        self.__lock = Lock()
+
+    @property
+    def full(self):
+        return self.size >= CACHE_MEMORY.maxsize * PRELOAD_MEMORY
+
+    def load(self, cache: Cache, *args):
+        """
+        Lee (si existe y no está caducada) la entrada de cache para args
+        y la devuelve, o None si no se ha podido precargar
+        """
+        if self.full:
+            return None
+        fl = cache.parse_file_name(*args)
+        st = cache.stat(fl)
+        if cache.tooOld(fl, st=st):
+            return None
+        data = cache.memo_read(fl, st)
+        if data is not None:
+            with self.__lock:
+                self.size = self.size + estimate_size(data, st.st_size)
+                self.count = self.count + 1
+        return data
+
+    def run(self, task: Callable, items: Iterable[Tuple]):
+        """
+        Ejecuta task(self, *item) para cada item en un ThreadPoolExecutor
+        """
+        items = tuple(items)
+        if len(items) == 0 or CACHE_MEMORY.maxsize <= 0:
+            return
+        ini = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in executor.map(lambda item: task(self, *item), items):
+                pass
+        logger.info(
+            f"{self.count} entradas precargadas ({self.size/1024/1024:.1f} MB estimados) "
+            f"en {time.perf_counter() - ini:.2f}s con {self.workers} hilos"
+            + (" [memoria llena]" if self.full else "")
+        )
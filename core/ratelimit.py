@@ -0,0 +1,137 @@
+import time
+import logging
+from os import environ
+from threading import Lock
+from typing import Dict, Tuple, Union
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Permite rate peticiones por segundo de media con ráfagas de hasta burst.
+    Cada petición reserva un token (aunque el saldo quede en negativo)
+    y espera fuera del lock a que le toque, así que el orden es el de llegada
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.count = 0
+        self.waited = 0
+        self.__last = time.monotonic()
+        self.__lock = Lock()
+
+    def reserve(self) -> float:
+        """
+        Reserva un token y devuelve los segundos que hay que esperar para usarlo
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.__last) * self.rate)
+            self.__last = now
+            self.tokens = self.tokens - 1
+            self.count = self.count + 1
+            if self.tokens >= 0:
+                return 0
+            delay = -self.tokens / self.rate
+            self.waited = self.waited + delay
+            return delay
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def parse_rate(txt: str) -> Union[Tuple[float, int], None]:
+    """
+    rate[:burst] (peticiones por segundo y tamaño de la ráfaga) o None si no es válido
+    """
+    rate, _, burst = (txt or "").strip().partition(":")
+    try:
+        rate = float(rate)
+        burst = int(burst) if burst.strip() else 1
+    except ValueError:
+        return None
+    if rate <= 0:
+        return None
+    return rate, burst
+
+
+class RateLimiter:
+    """
+    Un TokenBucket por host, de manera que las peticiones a hosts
+    distintos no se esperan entre sí. Los hosts sin límite no esperan nunca
+    """
+
+    def __init__(self, rate: Tuple[float, int] = None, hosts: Dict[str, Tuple[float, int]] = None):
+        """
+        Parameters
+        ----------
+        rate: Tuple[float, int]
+            (peticiones por segundo, ráfaga) de cualquier host o None para no limitar
+        hosts: Dict[str, Tuple[float, int]]
+            límite de hosts concretos (None para no limitarlo)
+        """
+        self.rate = rate
+        self.hosts = {k.lower(): v for k, v in (hosts or {}).items()}
+        self.__lock = Lock()
+        self.__buckets: Dict[str, TokenBucket] = {}
+
+    def get_bucket(self, url: str) -> Union[TokenBucket, None]:
+        host = (urlsplit(url).hostname or "").lower()
+        with self.__lock:
+            if host not in self.__buckets:
+                rate = self.hosts.get(host, self.rate)
+                self.__buckets[host] = TokenBucket(*rate) if rate else None
+            return self.__buckets[host]
+
+    def reserve(self, url: str) -> float:
+        bucket = self.get_bucket(url)
+        if bucket is None:
+            return 0
+        return bucket.reserve()
+
+    def __call__(self, url: str):
+        """
+        Espera hasta que se pueda hacer una petición a url
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_report(self) -> Dict[str, Dict]:
+        with self.__lock:
+            buckets = dict(self.__buckets)
+        return {
+            h: dict(count=b.count, waited=round(b.waited, 3))
+            for h, b in sorted(buckets.items()) if b is not None
+        }
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    RateLimiter configurado con:
+        RATE_LIMIT=rate[:burst] para cualquier host (si no está definido y
+            SESSION_DELAY sí, una petición cada (1+SESSION_DELAY)/2 segundos,
+            lo que se esperaba de media antes)
+        RATE_LIMIT_HOSTS=host=rate[:burst],... para hosts concretos
+            (un rate 0 deja el host sin límite)
+    """
+    rate = parse_rate(environ.get("RATE_LIMIT"))
+    delay = environ.get("SESSION_DELAY", "")
+    if rate is None and delay.isdigit() and int(delay) > 0:
+        rate = (2 / (1 + int(delay)), 1)
+    hosts = {}
+    for item in (environ.get("RATE_LIMIT_HOSTS") or "").split(","):
+        host, _, value = item.partition("=")
+        if host.strip():
+            hosts[host.strip()] = parse_rate(value)
+    return RateLimiter(rate=rate, hosts=hosts)
+
+
+# compartido por Web, WP, las descargas de carteles, AioWeb y Driver
+RATE_LIMITER = get_rate_limiter()
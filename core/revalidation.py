@@ -0,0 +1,73 @@
+import json
+import hashlib
+from threading import local
+from contextlib import contextmanager
+from typing import Dict, Union
+
+_current = local()
+
+
+class NotModified(Exception):
+    """El servidor ha respondido 304 a una petición condicional"""
+    pass
+
+
+def get_request_signature(method: str, url: str, data: Dict = None) -> str:
+    js = json.dumps([method, url, sorted((data or {}).items())], default=str)
+    return hashlib.sha256(js.encode()).hexdigest()
+
+
+class Revalidation:
+    """
+    Validadores (ETag y Last-Modified) de la petición con la que se generó
+    una entrada de la caché y los de la última respuesta recibida
+    """
+
+    def __init__(self, validators: Dict[str, str] = None):
+        self.validators = validators or {}
+        self.last: Union[Dict[str, str], None] = None
+
+    def get_headers(self, signature: str, headers: Dict[str, str] = None):
+        """
+        Añade If-None-Match / If-Modified-Since a headers si la petición
+        es la misma que generó la entrada de la caché
+        """
+        if self.validators.get('signature') != signature:
+            return headers
+        headers = dict(headers or {})
+        if self.validators.get('etag'):
+            headers['If-None-Match'] = self.validators['etag']
+        if self.validators.get('last_modified'):
+            headers['If-Modified-Since'] = self.validators['last_modified']
+        return headers
+
+    def set_response(self, signature: str, headers: Dict[str, str]):
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            self.last = None
+            return
+        self.last = dict(
+            signature=signature,
+            etag=etag,
+            last_modified=last_modified
+        )
+
+
+def get_revalidation() -> Union[Revalidation, None]:
+    return getattr(_current, "revalidation", None)
+
+
+@contextmanager
+def revalidation(validators: Dict[str, str] = None):
+    """
+    Durante el bloque (y solo en este hilo) Web.get hace peticiones
+    condicionales con validators y lanza NotModified si recibe un 304
+    """
+    old = get_revalidation()
+    rv = Revalidation(validators)
+    _current.revalidation = rv
+    try:
+        yield rv
+    finally:
+        _current.revalidation = old
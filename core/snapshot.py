@@ -0,0 +1,57 @@
+import marshal
+import struct
+import logging
+from dataclasses import fields
+from typing import Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SNAP"
+HEADER = struct.Struct(">4sHH")
+
+
+class Snapshot:
+    """
+    Formato binario para colecciones de objetos de la clase cls:
+
+        MAGIC + versión + longitud del nombre + nombre de la clase + marshal((campos, filas))
+
+    cls ha de tener to_row (el objeto como tupla de tipos básicos) y from_row
+    (el objeto a partir de esa tupla sin volver a limpiar sus campos).
+    Si cambia la versión, el nombre o los campos de la clase el snapshot
+    se ignora y hay que volver a leer el json
+    """
+
+    def __init__(self, cls: type, version: int):
+        self.cls = cls
+        self.version = version
+        self.name = cls.__name__.encode()
+        self.fields = tuple(f.name for f in fields(cls))
+
+    def accept(self, data) -> bool:
+        return isinstance(data, (list, tuple)) and all(isinstance(d, self.cls) for d in data)
+
+    def dumps(self, data: Tuple) -> bytes:
+        rows = tuple(d.to_row() for d in data)
+        header = HEADER.pack(MAGIC, self.version, len(self.name))
+        return header + self.name + marshal.dumps((self.fields, rows))
+
+    def loads(self, content: bytes) -> Union[Tuple, None]:
+        if content is None or len(content) < HEADER.size:
+            return None
+        magic, version, size = HEADER.unpack_from(content)
+        start = HEADER.size + size
+        name = content[HEADER.size:start]
+        if (magic, version, name) != (MAGIC, self.version, self.name):
+            logger.debug(f"snapshot {magic}/{version}/{name} distinto de {MAGIC}/{self.version}/{self.name}")
+            return None
+        try:
+            flds, rows = marshal.loads(content[start:])
+        except (EOFError, ValueError, TypeError) as e:
+            logger.warning(f"snapshot corrupto: {e}")
+            return None
+        if tuple(flds) != self.fields:
+            logger.debug(f"snapshot con campos {flds} distintos de {self.fields}")
+            return None
+        from_row = self.cls.from_row
+        return tuple(from_row(r) for r in rows)
@@ -0,0 +1,102 @@
+import json
+import base64
+import logging
+import mimetypes
+from os import environ
+from pathlib import Path
+from typing import Union
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+from requests.adapters import BaseAdapter
+
+from .api import Api
+from .transport import build_response
+
+logger = logging.getLogger(__name__)
+
+
+class StandIn(BaseAdapter):
+    """
+    Sustituto local de las webs que usa build_site: responde a las peticiones
+    de requests con los ficheros de un juego de datos congelado
+    (ver tool/bench_e2e.py) que tiene la misma estructura que rec/
+
+        catalog/{nombre}.html   catálogo (teatros2.php -> catalog/teatros2.html)
+        detail/{id}.html        detalle_evento.php (el id sale del content en base64)
+        day/{id}.html           compra/?eventocurrence={id}
+        wp/image.json           /?rest_route=/wp/v2/media/...
+        page/{nombre}           PAGE_URL/{nombre} (fechas.json y eventos.json)
+        img/{host}/{path}       cualquier otra url (los carteles)
+
+    Lo que no está en el juego de datos devuelve un 404
+    """
+
+    def __init__(self, fixtures: Union[str, Path]):
+        super().__init__()
+        self.root = Path(fixtures)
+        self.page = urlsplit(environ.get('PAGE_URL', '')).netloc.lower()
+        self.hits = 0
+        self.misses = 0
+
+    def route(self, request: requests.PreparedRequest) -> Union[Path, str, None]:
+        url = request.url
+        spl = urlsplit(url)
+        host = spl.netloc.lower()
+        if url.startswith(Api.URLDAY):
+            return self.root.joinpath("day", url[len(Api.URLDAY):] + ".html")
+        if url.split("?")[0] == Api.DETAIL:
+            body = request.body or ""
+            if isinstance(body, bytes):
+                body = body.decode()
+            content = dict(parse_qsl(body)).get('content')
+            if content is None:
+                return None
+            js = json.loads(base64.b64decode(content).decode())
+            return self.root.joinpath("detail", f"{js['id']}.html")
+        if host == "programacion.abonoteatro.com":
+            name = spl.path.rstrip("/").split("/")[-1].rsplit(".", 1)[0]
+            return self.root.joinpath("catalog", name + ".html")
+        if host == "compras.abonoteatro.com" and "rest_route" in spl.query:
+            qr = dict(parse_qsl(spl.query))
+            route = qr.get('rest_route', '')
+            if route.startswith("/wp/v2/media") and qr.get('page') == "1":
+                return self.root.joinpath("wp", "image.json")
+            return "[]" if route.startswith("/wp/v2/") else "{}"
+        if self.page and host == self.page:
+            return self.root.joinpath("page", spl.path.rstrip("/").split("/")[-1])
+        return self.root.joinpath("img", host + spl.path)
+
+    def send(self, request: requests.PreparedRequest, **kwargs):
+        fl = self.route(request)
+        status, content = 404, b""
+        if isinstance(fl, str):
+            status, content = 200, fl.encode()
+        elif fl is not None and fl.is_file():
+            status, content = 200, fl.read_bytes()
+        if status == 200:
+            self.hits = self.hits + 1
+        else:
+            self.misses = self.misses + 1
+            logger.warning(f"StandIn 404 {request.method} {request.url}")
+        ctype = mimetypes.guess_type(str(fl))[0] if isinstance(fl, Path) else None
+        return build_response(self, request, status, content, {
+            "Content-Type": ctype or "application/octet-stream"
+        })
+
+    def close(self):
+        pass
+
+
+def install(fixtures: Union[str, Path]):
+    """
+    Hace que todas las requests.Session (y requests.get) respondan con StandIn
+    """
+    adapter = StandIn(fixtures)
+
+    def get_adapter(self, url):
+        return adapter
+
+    requests.Session.get_adapter = get_adapter
+    logger.info(f"StandIn en {fixtures}")
+    return adapter
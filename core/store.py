@@ -0,0 +1,122 @@
+import os
+import time
+import atexit
+import sqlite3
+import logging
+from os import environ
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class StoreStat(NamedTuple):
+    """Lo que Cache necesita de os.stat_result"""
+    st_mtime: float
+    st_mtime_ns: int
+    st_size: int
+
+
+class SqliteStore:
+    """
+    Guarda las entradas de las cachés en una única base de datos sqlite
+    (clave = ruta relativa del fichero que se hubiera escrito) en modo WAL
+    y haciendo commit cada batch escrituras
+    """
+
+    def __init__(self, file: Union[str, Path], batch: int = 100):
+        self.file = Path(file)
+        self.batch = batch
+        self.__lock = Lock()
+        self.__pid = None
+        self.__db: sqlite3.Connection = None
+        self.__pending = 0
+        self.__owner = os.getpid()
+        atexit.register(self.close)
+
+    @property
+    def db(self):
+        # tras un fork (ProcessPoolExecutor) cada proceso abre su propia conexión
+        if self.__pid != os.getpid():
+            self.__pid = os.getpid()
+            self.__pending = 0
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            self.__db = sqlite3.connect(self.file, timeout=60, check_same_thread=False)
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("PRAGMA synchronous=NORMAL")
+            self.__db.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    blob BLOB NOT NULL,
+                    mtime REAL NOT NULL,
+                    ctype TEXT
+                )
+            """)
+            self.__db.commit()
+        return self.__db
+
+    def get(self, key: str) -> Union[bytes, None]:
+        with self.__lock:
+            row = self.db.execute("SELECT blob FROM cache WHERE key = ?", (key, )).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def stat(self, key: str) -> Union[StoreStat, None]:
+        with self.__lock:
+            row = self.db.execute("SELECT mtime, length(blob) FROM cache WHERE key = ?", (key, )).fetchone()
+        if row is None:
+            return None
+        return StoreStat(st_mtime=row[0], st_mtime_ns=int(row[0] * 1e9), st_size=row[1])
+
+    def put(self, key: str, blob: bytes, ctype: str = None):
+        with self.__lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache (key, blob, mtime, ctype) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(blob), time.time(), ctype)
+            )
+            self.__written()
+
+    def touch(self, key: str):
+        with self.__lock:
+            self.db.execute("UPDATE cache SET mtime = ? WHERE key = ?", (time.time(), key))
+            self.__written()
+
+    def delete(self, key: str):
+        with self.__lock:
+            self.db.execute("DELETE FROM cache WHERE key = ?", (key, ))
+            self.__written()
+
+    def __written(self):
+        self.__pending = self.__pending + 1
+        # los procesos hijos no ejecutan atexit, así que no acumulan escrituras
+        if self.__pending >= self.batch or self.__pid != self.__owner:
+            self.__db.commit()
+            self.__pending = 0
+
+    def commit(self):
+        with self.__lock:
+            if self.__db is not None and self.__pid == os.getpid():
+                self.__db.commit()
+                self.__pending = 0
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None and self.__pid == os.getpid():
+                self.__db.commit()
+                self.__db.close()
+            self.__db = None
+            self.__pid = None
+
+
+def get_store(root: Path) -> Union[SqliteStore, None]:
+    """
+    SqliteStore en CACHE_STORE (por ejemplo rec/cache.sqlite, relativo a root)
+    o None si no está definido
+    """
+    file = environ.get("CACHE_STORE")
+    if not file:
+        return None
+    batch = environ.get("CACHE_STORE_BATCH", "")
+    return SqliteStore(Path(root).joinpath(file), batch=int(batch) if batch.isdigit() else 100)
@@ -0,0 +1,232 @@
+import time
+import random
+import logging
+from itertools import takewhile
+from os import environ
+from threading import Lock
+from typing import Dict, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from .cachestats import Histogram, get_labels
+from .filemanager import FM
+
+logger = logging.getLogger(__name__)
+
+# respuestas que se reintentan (429 y 503 respetando Retry-After)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def get_env_float(name: str, default: float):
+    v = environ.get(name)
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_timeout() -> Tuple[float, float]:
+    """
+    HTTP_TIMEOUT=connect[:read] en segundos (por defecto 10:60)
+    """
+    connect, _, read = (environ.get("HTTP_TIMEOUT") or "").partition(":")
+    try:
+        connect = float(connect)
+    except ValueError:
+        return (10, 60)
+    try:
+        read = float(read)
+    except ValueError:
+        read = connect
+    return (connect, read)
+
+
+class HttpStats:
+    """
+    Por host: peticiones, errores (excepciones tras agotar los reintentos),
+    reintentos por motivo (código de estado o excepción) y latencia
+    de cada petición (incluidos sus reintentos)
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.hosts: Dict[str, Dict] = {}
+
+    def __get(self, host: str):
+        if host not in self.hosts:
+            self.hosts[host] = dict(requests=0, errors=0, retries={}, latency=Histogram())
+        return self.hosts[host]
+
+    def observe(self, host: str, seconds: float, error: bool = False):
+        with self.__lock:
+            st = self.__get(host)
+            st['requests'] = st['requests'] + 1
+            st['errors'] = st['errors'] + int(error)
+            st['latency'].observe(seconds)
+
+    def retry(self, host: str, reason: str):
+        with self.__lock:
+            retries = self.__get(host)['retries']
+            retries[reason] = retries.get(reason, 0) + 1
+
+    def to_dict(self) -> Dict[str, Dict]:
+        with self.__lock:
+            return {
+                h: dict(
+                    requests=st['requests'],
+                    errors=st['errors'],
+                    retries=dict(sorted(st['retries'].items())),
+                    latency=st['latency'].to_dict()
+                )
+                for h, st in sorted(self.hosts.items())
+            }
+
+    def to_prometheus(self) -> str:
+        report = self.to_dict()
+        lines = []
+        for c in ("requests", "errors"):
+            lines.append(f"# TYPE http_{c}_total counter")
+            for host, js in report.items():
+                lines.append(f"http_{c}_total{get_labels(host=host)} {js[c]}")
+        lines.append("# TYPE http_retries_total counter")
+        for host, js in report.items():
+            for reason, count in js['retries'].items():
+                lines.append(f"http_retries_total{get_labels(host=host, reason=reason)} {count}")
+        lines.append("# TYPE http_request_seconds histogram")
+        for host, js in report.items():
+            for le, count in js['latency']['buckets'].items():
+                lines.append(f"http_request_seconds_bucket{get_labels(host=host, le=le)} {count}")
+            lines.append(f"http_request_seconds_sum{get_labels(host=host)} {js['latency']['sum']}")
+            lines.append(f"http_request_seconds_count{get_labels(host=host)} {js['latency']['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file: str):
+        report = self.to_dict()
+        FM.dump(file, report)
+        return report
+
+
+HTTP_STATS = HttpStats()
+
+
+def build_response(adapter: BaseAdapter, request: requests.PreparedRequest, status: int, content: bytes, headers: Dict[str, str] = None, reason: str = None):
+    """
+    requests.Response como la que devolvería el servidor
+    """
+    r = requests.Response()
+    r.status_code = status
+    r.reason = reason or ("OK" if status == 200 else "Not Found")
+    r._content = content
+    r.url = request.url
+    r.request = request
+    r.encoding = "utf-8"
+    r.headers = CaseInsensitiveDict({
+        **(headers or {}),
+        "Content-Length": str(len(content))
+    })
+    r.connection = adapter
+    return r
+
+
+class JitterRetry(Retry):
+    """
+    Retry con espera exponencial (backoff_factor * 2^(n-1)) de la que se
+    espera entre la mitad y el total al azar, para que los hilos que fallan
+    a la vez no reintenten a la vez. Si la respuesta trae Retry-After
+    urllib3 espera lo que diga. Cada reintento se apunta en HTTP_STATS
+    """
+
+    def get_backoff_time(self):
+        errors = len(list(takewhile(lambda x: x.redirect_location is None, reversed(self.history))))
+        if errors == 0 or self.backoff_factor <= 0:
+            return 0
+        backoff = min(self.DEFAULT_BACKOFF_MAX, self.backoff_factor * (2 ** (errors - 1)))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new = super().increment(
+            method=method,
+            url=url,
+            response=response,
+            error=error,
+            _pool=_pool,
+            _stacktrace=_stacktrace
+        )
+        host = getattr(_pool, "host", None) or ""
+        if error is not None:
+            reason = type(error).__name__
+        else:
+            reason = str(getattr(response, "status", None))
+        HTTP_STATS.retry(host, reason)
+        logger.info(f"Reintento {len(new.history)} en {host}{url or ''}: {reason}")
+        return new
+
+
+class Transport(HTTPAdapter):
+    """
+    HTTPAdapter con JitterRetry, timeout por defecto y latencia en HTTP_STATS
+    """
+
+    def __init__(self, retries: int = 3, backoff: float = 1, pool_size: int = 10, timeout: Tuple[float, float] = (10, 60)):
+        """
+        Parameters
+        ----------
+        retries: int
+            reintentos de cada petición (errores de conexión, de lectura y RETRY_STATUS).
+            También se reintentan los POST porque en esta web son consultas
+        backoff: float
+            backoff_factor de JitterRetry
+        pool_size: int
+            conexiones que se mantienen abiertas por host (las que pueden usar
+            a la vez los hilos que comparten el Transport, ver Web.clone)
+        timeout: Tuple[float, float]
+            (conexión, lectura) en segundos de las peticiones que no indican otro
+        """
+        self.timeout = timeout
+        super().__init__(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=JitterRetry(
+                total=retries,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS.union(("POST", )),
+                backoff_factor=backoff,
+                raise_on_status=False
+            )
+        )
+
+    def send(self, request: requests.PreparedRequest, timeout=None, **kwargs):
+        host = urlsplit(request.url).hostname or ""
+        ini = time.perf_counter()
+        try:
+            r = super().send(request, timeout=timeout or self.timeout, **kwargs)
+        except Exception:
+            HTTP_STATS.observe(host, time.perf_counter() - ini, error=True)
+            raise
+        HTTP_STATS.observe(host, time.perf_counter() - ini)
+        return r
+
+
+def mount_transport(s: requests.Session, pool_size: Union[int, None] = None) -> requests.Session:
+    """
+    Monta en s un Transport configurado con:
+        HTTP_RETRIES (3), HTTP_BACKOFF (1 segundo), HTTP_POOL_SIZE (10)
+        y HTTP_TIMEOUT (10:60, ver get_timeout)
+    """
+    adapter = Transport(
+        retries=int(get_env_float("HTTP_RETRIES", 3)),
+        backoff=get_env_float("HTTP_BACKOFF", 1),
+        pool_size=pool_size or int(get_env_float("HTTP_POOL_SIZE", 10)),
+        timeout=get_timeout()
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def new_session() -> requests.Session:
+    return mount_transport(requests.Session())
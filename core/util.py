@@ -3,12 +3,12 @@ from typing import List, Dict, Union, Set, Tuple
 from bs4 import Tag, BeautifulSoup
 from minify_html import minify
 import unicodedata
-import requests
 import logging
 from unidecode import unidecode
 from urllib.parse import urlparse
 import pytz
 from datetime import datetime
+from .transport import new_session
 
 logger = logging.getLogger(__name__)
 
@@ -230,10 +230,18 @@ def dict_tuple(obj: Dict[str, Union[Set, List, Tuple]]):
     return {k: tuple(sorted(set(v))) for k, v in obj.items()}
 
 
+def scrub_url(url: str):
+    """
+    Oculta los tokens de url (para los logs y lo que se guarda en disco)
+    """
+    return re.sub(r"\btoken=\w+", "token=***", url)
+
+
 def safe_get_list_dict(url) -> List[Dict]:
     js = []
     try:
-        r = requests.get(url)
+        with new_session() as s:
+            r = s.get(url)
         js = r.json()
     except Exception:
         logger.critical(url+" no se puede recuperar", exc_info=True)
@@ -251,7 +259,8 @@ def safe_get_list_dict(url) -> List[Dict]:
 def safe_get_dict(url) -> Dict:
     js = {}
     try:
-        r = requests.get(url)
+        with new_session() as s:
+            r = s.get(url)
         js = r.json()
     except Exception:
         logger.critical(url+" no se puede recuperar", exc_info=True)
@@ -313,7 +322,8 @@ def re_and(s: str, *args: Union[str, Tuple[str]]):
 
 
 def get_redirect(url: str):
-    r = requests.get(url, allow_redirects=False)
+    with new_session() as s:
+        r = s.get(url, allow_redirects=False)
     return r.headers.get('Location')
 
 
@@ -1,12 +1,13 @@
 import os
 import re
 import time
+import atexit
 from urllib.parse import parse_qsl, urljoin, urlsplit
 import curlify
 
 
 import requests
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.chrome import ChromeType
 from webdriver_manager.core.utils import read_version_from_cmd
@@ -28,9 +29,13 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.remote.webelement import WebElement
 import logging
-from typing import Union
-import random
+from typing import Union, Dict, List, Callable
 from functools import wraps
+from threading import BoundedSemaphore, Lock
+from contextlib import contextmanager
+from .revalidation import get_revalidation, get_request_signature, NotModified
+from .ratelimit import RATE_LIMITER, TokenBucket
+from .transport import mount_transport
 
 logger = logging.getLogger(__name__)
 
@@ -56,15 +61,12 @@ default_headers = {
 }
 
 
-def mk_delay(name, min_delay=1, max_delay=3):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            delay = random.uniform(min_delay, max_delay)
-            time.sleep(delay)
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+def throttle(bucket: TokenBucket, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        bucket.wait()
+        return func(*args, **kwargs)
+    return wrapper
 
 
 def get_query(url):
@@ -88,8 +90,10 @@ def iterhref(soup: BeautifulSoup):
             yield n, attr, val
 
 
-def buildSoup(root: str, source: str, parser="lxml"):
-    soup = BeautifulSoup(source, parser)
+def buildSoup(root: str, source: str, parser="lxml", parse_only: SoupStrainer = None, absolute: bool = True):
+    soup = BeautifulSoup(source, parser, parse_only=parse_only)
+    if not absolute:
+        return soup
     for n, attr, val in iterhref(soup):
         val = urljoin(root, val)
         n.attrs[attr] = val
@@ -114,17 +118,61 @@ def get_text(node: Tag, default: str = None):
     return txt
 
 
+class HostLimit:
+    """Limita el número de peticiones simultáneas contra un mismo host"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.__lock = Lock()
+        self.__hosts: Dict[str, BoundedSemaphore] = {}
+
+    def get_semaphore(self, url: str):
+        host = urlsplit(url).netloc.lower()
+        with self.__lock:
+            if host not in self.__hosts:
+                self.__hosts[host] = BoundedSemaphore(self.size)
+            return self.__hosts[host]
+
+    @contextmanager
+    def __call__(self, url: str):
+        with self.get_semaphore(url):
+            yield
+
+
 class Web:
-    def __init__(self, refer=None, verify=True):
-        self.s = requests.Session()
+    def __init__(self, refer=None, verify=True, host_limit: HostLimit = None):
+        self.s = mount_transport(requests.Session())
         self.s.headers = default_headers
         self.response = None
-        self.soup = None
+        self.content: bytes = None
+        self.__soup: BeautifulSoup = None
+        self.__parse = None
         self.form = None
         self.refer = refer
         self.verify = verify
+        self.host_limit = host_limit
+
+    def clone(self, host_limit: HostLimit = None):
+        """
+        Crea un Web con su propia requests.Session (para usarlo desde otro hilo)
+        que comparte las cookies y el Transport (y con él el pool de
+        HTTP_POOL_SIZE conexiones por host) con este
+        """
+        w = Web(refer=self.refer, verify=self.verify, host_limit=host_limit or self.host_limit)
+        w.s.headers = dict(self.s.headers)
+        w.s.cookies = self.s.cookies
+        for prefix, adapter in self.s.adapters.items():
+            w.s.mount(prefix, adapter)
+        return w
 
     def _get(self, url, allow_redirects=True, auth=None, headers=None, **kwargs):
+        RATE_LIMITER(url)
+        if self.host_limit is None:
+            return self.__get(url, allow_redirects=allow_redirects, auth=auth, headers=headers, **kwargs)
+        with self.host_limit(url):
+            return self.__get(url, allow_redirects=allow_redirects, auth=auth, headers=headers, **kwargs)
+
+    def __get(self, url, allow_redirects=True, auth=None, headers=None, **kwargs):
         if kwargs:
             return self.s.post(url, headers=headers, data=kwargs, allow_redirects=allow_redirects, verify=self.verify, auth=auth)
         return self.s.get(url, headers=headers, allow_redirects=allow_redirects, verify=self.verify, auth=auth)
@@ -134,13 +182,57 @@ class Web:
             return None
         return curlify.to_curl(self.response.request)
 
-    def get(self, url, auth=None, parser="lxml", headers=None, **kwargs):
+    @property
+    def soup(self) -> BeautifulSoup:
+        """
+        html de la última respuesta, que se parsea la primera vez que se pide
+        """
+        if self.__soup is None and self.content is not None:
+            url, parser, strainer, absolute = self.__parse
+            self.__soup = buildSoup(url, self.content, parser=parser, parse_only=strainer, absolute=absolute)
+        return self.__soup
+
+    @property
+    def strained(self) -> bool:
+        """
+        si soup solo tiene los tags de un SoupStrainer (ver fetch)
+        """
+        return self.__parse is not None and self.__parse[2] is not None
+
+    def get(self, url, auth=None, parser="lxml", headers=None, strainer: SoupStrainer = None, absolute: bool = None, **kwargs):
+        self.fetch(url, auth=auth, parser=parser, headers=headers, strainer=strainer, absolute=absolute, **kwargs)
+        return self.soup
+
+    def fetch(self, url, auth=None, parser="lxml", headers=None, strainer: SoupStrainer = None, absolute: bool = None, **kwargs):
+        """
+        Como get pero sin parsear la respuesta (ver soup)
+
+        Parameters
+        ----------
+        strainer: SoupStrainer
+            parsear solo los tags que cumplan strainer (con todo su contenido),
+            por ejemplo SoupStrainer("input", attrs={"type": "hidden"})
+        absolute: bool
+            convertir en absolutas las urls de href, src y action
+            (por defecto sí, salvo si se usa strainer)
+        """
         if self.refer:
             self.s.headers.update({'referer': self.refer})
-        self.response = self._get(url, auth=auth, headers=headers, **kwargs)
+        rv = get_revalidation()
+        if rv is not None:
+            signature = get_request_signature("POST" if kwargs else "GET", url, kwargs)
+            headers = rv.get_headers(signature, headers)
+        r = self._get(url, auth=auth, headers=headers, **kwargs)
+        if rv is not None:
+            rv.set_response(signature, r.headers)
+            if r.status_code == 304:
+                # response, content y soup siguen siendo los de la página anterior
+                raise NotModified(url)
+        self.response = r
         self.refer = self.response.url
-        self.soup = buildSoup(url, self.response.content, parser=parser)
-        return self.soup
+        self.content = self.response.content
+        self.__soup = None
+        self.__parse = (url, parser, strainer, (strainer is None) if absolute is None else absolute)
 
     def prepare_submit(self, slc, silent_in_fail=False, **kwargs):
         data = {}
@@ -310,6 +402,8 @@ class Driver:
             raise Exception("Not implemented yet: %s" % self.__browser)
         driver = crt()
         if self.__human_delay > 1:
+            # de media una acción cada (1+human_delay)/2 segundos, sin esperar si ya ha pasado ese tiempo
+            bucket = TokenBucket(rate=2 / (1 + self.__human_delay))
             mths = ('get', 'find_element', 'find_elements', 'click', 'send_keys')
             for m in dir(driver):
                 if not (m in mths or m.startswith("find_element") or m.startswith("move_to")):
@@ -318,13 +412,7 @@ class Driver:
                 if not callable(ori):
                     continue
                 logger.info(f"Driver.{m} set delay")
-                new_mth = mk_delay(f"Driver.{m}", max_delay=self.__human_delay)(ori)
-
-                setattr(
-                    driver,
-                    m,
-                    new_mth
-                )
+                setattr(driver, m, throttle(bucket, ori))
         return driver
 
 
@@ -376,6 +464,7 @@ class Driver:
 
     def get(self, url):
         logger.debug(url)
+        RATE_LIMITER(url)
         self.driver.get(url)
 
     def get_soup(self, root: str = None):
@@ -397,6 +486,29 @@ class Driver:
             return None
         return self.__driver.page_source
 
+    @property
+    def alive(self):
+        """
+        El navegador está abierto y responde
+        """
+        if self.__driver is None:
+            return False
+        try:
+            self.__driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def reset(self):
+        """
+        Deja el navegador como para empezar a usarlo de nuevo
+        (una sola ventana y fuera de cualquier iframe)
+        """
+        if self.__driver is None:
+            return
+        self.close_others(0)
+        self.__driver.switch_to.default_content()
+
     def wait(self, id: Union[int, float, str], seconds=None, presence=False, by=None) -> WebElement:
         if isinstance(id, (int, float)):
             time.sleep(id)
@@ -515,3 +627,97 @@ class Driver:
         with open(file, "r") as f:
             js = f.read()
         return self.execute_script(js)
+
+
+class DriverPool:
+    """
+    Mantiene abiertos (y con la sesión iniciada) hasta size navegadores
+    durante toda la ejecución para no tener que arrancar uno y volver a
+    hacer login cada vez que hace falta.
+    Los Driver que crea create han de tener login() y logged
+    """
+
+    def __init__(self, create: Callable[[], Driver], size: int = 1):
+        """
+        Parameters
+        ----------
+        create: Callable
+            crea un Driver nuevo (sin abrir el navegador ni hacer login)
+        size: int
+            máximo de navegadores abiertos a la vez
+        """
+        self.create = create
+        self.size = size
+        self.__lock = Lock()
+        self.__free = BoundedSemaphore(size)
+        self.__idle: List[Driver] = []
+        atexit.register(self.close)
+
+    def __check(self, d: Driver):
+        """
+        Devuelve d listo para usar: si el navegador no responde
+        se abre otro y si la sesión ha caducado se vuelve a hacer login
+        """
+        if d is not None and not d.alive:
+            logger.warning("El navegador no responde, se abre otro")
+            self.__quit(d)
+            d = None
+        if d is None:
+            d = self.create()
+        try:
+            if not d.logged:
+                d.login()
+        except BaseException:
+            self.__quit(d)
+            raise
+        return d
+
+    def __quit(self, d: Driver):
+        try:
+            d.close()
+        except WebDriverException:
+            pass
+
+    @contextmanager
+    def lease(self):
+        """
+        Presta un Driver con la sesión iniciada. Si el bloque termina con
+        WebDriverException el navegador se cierra en vez de devolverse al pool
+        """
+        self.__free.acquire()
+        d = None
+        try:
+            with self.__lock:
+                idle = self.__idle.pop() if self.__idle else None
+            try:
+                d = self.__check(idle)
+            except BaseException:
+                # __check ya ha cerrado el navegador: no se devuelve al pool
+                d = None
+                raise
+            yield d
+        except WebDriverException:
+            if d is not None:
+                self.__quit(d)
+            d = None
+            raise
+        finally:
+            if d is not None:
+                self.__release(d)
+            self.__free.release()
+
+    def __release(self, d: Driver):
+        try:
+            d.reset()
+        except WebDriverException:
+            self.__quit(d)
+            return
+        with self.__lock:
+            self.__idle.append(d)
+
+    def close(self):
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = []
+        for d in idle:
+            self.__quit(d)
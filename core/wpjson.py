@@ -6,6 +6,7 @@ from urllib.parse import urlencode
 from json.decoder import JSONDecodeError
 import logging
 from .cache import Cache
+from .ratelimit import RATE_LIMITER
 from typing import Tuple, Dict, List
 
 logger = logging.getLogger(__name__)
@@ -30,6 +31,7 @@ class WP:
         self.info = self.get("/")
 
     def __json(self, url):
+        RATE_LIMITER(url)
         r = self.s.get(url)
         self.last_url = r.url
         try:
@@ -0,0 +1,50 @@
+"""
+Compara el motor de reglas compilado de core.category con la evaluación
+clásica con re_or / re_and sobre los eventos guardados en rec/event/*.json
+(no usa el texto OCR de los carteles)
+
+    python3 -m tool.bench_category [--repeat 20] [rec/event/*.json]
+"""
+import argparse
+import time
+from glob import glob
+from pathlib import Path
+
+from core.category import CATEGORY_RULES, CategoryFields
+from core.filemanager import FM
+
+parser = argparse.ArgumentParser(description='Benchmark de Api.find_category')
+parser.add_argument('--repeat', type=int, default=20, help='Veces que se evalúa cada evento')
+parser.add_argument('files', nargs='*', help='Ficheros rec/event/*.json')
+args = parser.parse_args()
+
+files = args.files or sorted(glob(str(FM.resolve_path("rec/event/*.json"))))
+fields = []
+for file in files:
+    url = Path(file).stem
+    for js in FM.load(file):
+        if js['name'] == "Compra o Regala ABONOTEATRO":
+            continue
+        fields.append(CategoryFields.build(url, js))
+
+if len(fields) == 0:
+    raise SystemExit("No hay eventos en rec/event/*.json")
+
+
+def run(compiled: bool):
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        result = tuple(CATEGORY_RULES.find(f, compiled=compiled) for f in fields)
+    return time.perf_counter() - start, result
+
+
+t_old, r_old = run(compiled=False)
+t_new, r_new = run(compiled=True)
+diff = sum(1 for o, n in zip(r_old, r_new) if o != n)
+
+print(f"{len(fields)} eventos de {len(files)} ficheros x {args.repeat}")
+print(f"re_or/re_and: {t_old:.3f}s")
+print(f"compilado:    {t_new:.3f}s (x{t_old/t_new:.1f})")
+print(f"diferencias:  {diff}")
+if diff > 0:
+    raise SystemExit(1)
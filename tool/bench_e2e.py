@@ -0,0 +1,158 @@
+"""
+Ejecuta build_site.py completo sin red contra un juego de datos congelado
+(servido por core.standin) y guarda el tiempo real, el tiempo de cpu
+y el pico de memoria de cada fase
+
+Congelar el rec/ actual como juego de datos:
+
+    python3 -m tool.bench_e2e --freeze bench/fixtures
+
+Medir una ejecución en frío (rec/ y out/ vacíos) y otra en caliente (reutilizando ambos):
+
+    python3 -m tool.bench_e2e bench/fixtures --out bench/results.json [--jobs 4] [--crawlers 4] [--preload 4]
+
+Si el juego de datos tiene ocr/ se copia a rec/ocr antes de empezar
+para no depender de tesseract
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CODE = ("build_site.py", "core", "template", "out/rec")
+
+
+def freeze(target: Path):
+    rec = ROOT.joinpath("rec")
+    if not rec.is_dir():
+        raise SystemExit(f"No existe {rec}")
+    target.mkdir(parents=True, exist_ok=True)
+    for d in ("detail", "day", "ocr"):
+        if rec.joinpath(d).is_dir():
+            shutil.copytree(rec.joinpath(d), target.joinpath(d), dirs_exist_ok=True)
+    # rec/img/{host}/{path}.txt tiene el sha256 del cartel guardado en rec/poster
+    for fl in sorted(rec.glob("img/**/*.txt")):
+        h = fl.read_text().strip()
+        blob = rec.joinpath("poster", h[:2], h)
+        if blob.is_file():
+            img = target.joinpath(fl.relative_to(rec).with_suffix(""))
+            img.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(blob, img)
+    if rec.joinpath("wp", "image.json").is_file():
+        target.joinpath("wp").mkdir(exist_ok=True)
+        data = json.loads(rec.joinpath("wp", "image.json").read_text())
+        # la caché guarda {source_url: modified}, el stand-in sirve la api de wordpress
+        media = [
+            dict(id=i, source_url=u, modified=m.replace(" ", "T")+":00")
+            for i, (u, m) in enumerate(sorted(data.items()), start=1)
+        ]
+        target.joinpath("wp", "image.json").write_text(json.dumps(media))
+    target.joinpath("catalog").mkdir(exist_ok=True)
+    for fl in sorted(rec.glob("event/*.json")):
+        inputs = []
+        for js in json.loads(fl.read_text()):
+            js = {k: v for k, v in js.items() if k != "__parent__"}
+            value = base64.b64encode(json.dumps(js).encode()).decode()
+            inputs.append(f'<input type="hidden" id="event_content_json_id_{js["id"]}" value="{value}"/>')
+        html = "<html><body>\n" + "\n".join(inputs) + "\n</body></html>"
+        target.joinpath("catalog", fl.stem + ".html").write_text(html)
+    target.joinpath("page").mkdir(exist_ok=True)
+    for fl in (ROOT.joinpath("out", "fechas.json"), rec.joinpath("eventos.json")):
+        if fl.is_file():
+            shutil.copy(fl, target.joinpath("page", fl.name))
+    print(f"Juego de datos guardado en {target}")
+
+
+def run(tmp: Path, fixtures: Path, name: str, extra: list):
+    bench = tmp.joinpath(f"bench_{name}.json")
+    env = {
+        **{k: v for k, v in os.environ.items() if k != "SESSION_DELAY"},
+        "BENCH_FIXTURES": str(fixtures),
+        "PAGE_URL": "https://bench.invalid",
+        "REPO_URL": "https://bench.invalid/repo",
+        "PROGRAMA_TOKEN": "bench",
+    }
+    start = time.perf_counter()
+    r = subprocess.run(
+        [sys.executable, "build_site.py", "--bench", str(bench), *extra],
+        cwd=tmp,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if r.returncode != 0:
+        print(r.stderr[-5000:], file=sys.stderr)
+        raise SystemExit(f"build_site.py terminó con {r.returncode} en la ejecución {name}")
+    wall = time.perf_counter() - start
+    data = json.loads(bench.read_text())
+    data['process_wall'] = round(wall, 4)
+    return data
+
+
+def show(name: str, data: dict):
+    print(f"{name} ({data['process_wall']:.2f}s proceso)")
+    print(f"  {'fase':<10} {'real':>8} {'cpu':>8} {'cpu hijos':>10} {'rss MB':>8}")
+    for p in data['phases'] + [dict(name="total", **data['total'])]:
+        rss = max(p['maxrss'], p['maxrss_children']) / 1024
+        print(f"  {p['name']:<10} {p['wall']:>8.2f} {p['cpu']:>8.2f} {p['cpu_children']:>10.2f} {rss:>8.1f}")
+
+
+parser = argparse.ArgumentParser(description='Benchmark de build_site.py sin red')
+parser.add_argument('fixtures', nargs='?', help='Directorio con el juego de datos')
+parser.add_argument('--freeze', type=str, default=None, help='Congela el rec/ actual en este directorio y termina')
+parser.add_argument('--out', type=str, default=None, help='Fichero json donde guardar los resultados')
+parser.add_argument('--jobs', type=int, default=1)
+parser.add_argument('--crawlers', type=int, default=1)
+parser.add_argument('--preload', type=int, default=0)
+parser.add_argument('--keep', action='store_true', help='No borrar el directorio temporal')
+args = parser.parse_args()
+
+if args.freeze:
+    freeze(Path(args.freeze))
+    raise SystemExit(0)
+if args.fixtures is None:
+    parser.error("falta el directorio con el juego de datos")
+
+fixtures = Path(args.fixtures).resolve()
+tmp = Path(tempfile.mkdtemp(prefix="bench_e2e_"))
+for c in CODE:
+    src = ROOT.joinpath(c)
+    if src.is_dir():
+        shutil.copytree(src, tmp.joinpath(c), ignore=shutil.ignore_patterns("__pycache__"))
+    else:
+        shutil.copy(src, tmp.joinpath(c))
+if fixtures.joinpath("ocr").is_dir():
+    shutil.copytree(fixtures.joinpath("ocr"), tmp.joinpath("rec", "ocr"))
+
+extra = ["--jobs", str(args.jobs), "--crawlers", str(args.crawlers), "--preload", str(args.preload)]
+results = dict(
+    date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    python=platform.python_version(),
+    machine=platform.machine(),
+    fixtures=str(fixtures),
+    args=extra,
+    runs={}
+)
+try:
+    for name in ("cold", "warm"):
+        results['runs'][name] = run(tmp, fixtures, name, extra)
+        show(name, results['runs'][name])
+finally:
+    if not args.keep:
+        shutil.rmtree(tmp, ignore_errors=True)
+    else:
+        print(f"Ejecución en {tmp}")
+
+if args.out:
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,52 @@
+"""
+Memoria y tiempo de leer todas las páginas de detalle (rec/detail/*.html)
+dos veces con un functools.cache sin límite (lo que hacía FM.cached_load)
+y con FM.cached_load acotado por CACHE_MEMORY
+
+    python3 -m tool.bench_memory [--cap 64] [rec/detail/*.html]
+"""
+import argparse
+import functools
+import gc
+import time
+import tracemalloc
+from glob import glob
+
+from core.filemanager import FM
+from core.lru import CACHE_MEMORY
+
+parser = argparse.ArgumentParser(description='Benchmark de memoria de FM.cached_load')
+parser.add_argument('--cap', type=int, default=64, help='Tamaño máximo de CACHE_MEMORY en MB')
+parser.add_argument('files', nargs='*', help='Ficheros rec/detail/*.html')
+args = parser.parse_args()
+
+files = args.files or sorted(
+    f for f in glob(str(FM.resolve_path("rec/detail/*"))) if FM.get_ext(f) == ".html"
+)
+if len(files) == 0:
+    raise SystemExit("No hay ficheros en rec/detail/")
+
+
+def run(name: str, load):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(2):
+        for f in files:
+            load(f)
+    t = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<14} {t:>7.2f}s  actual {current/2**20:>8.1f} MB  pico {peak/2**20:>8.1f} MB")
+
+
+unbounded = functools.cache(FM.load)
+print(f"{len(files)} ficheros x 2")
+run("sin límite", unbounded)
+unbounded.cache_clear()
+del unbounded
+
+CACHE_MEMORY.clear()
+CACHE_MEMORY.maxsize = args.cap * 2**20
+run(f"LRU {args.cap} MB", FM.cached_load)
+print(f"LRU: {len(CACHE_MEMORY)} entradas, {CACHE_MEMORY.size/2**20:.1f} MB estimados, {CACHE_MEMORY.hits} aciertos")
@@ -0,0 +1,74 @@
+"""
+Mide la lectura de rec/eventos.json (json + Evento.build + __post_init__)
+frente a la de rec/eventos.snap (core.snapshot) con listas sintéticas de eventos
+
+    python3 -m tool.bench_snapshot [--sizes 1000 10000 100000] [--repeat 5]
+"""
+import argparse
+import json
+import random
+import time
+from dataclasses import asdict
+from os import environ
+
+environ.setdefault("PROGRAMA_TOKEN", "")
+
+from core.api import Evento, Lugar, Sesion, EVENTO_SNAPSHOT  # noqa: E402
+
+parser = argparse.ArgumentParser(description='Benchmark del snapshot de eventos')
+parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+parser.add_argument('--repeat', type=int, default=5)
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+
+def build_eventos(size: int):
+    rnd = random.Random(args.seed)
+    municipios = ["Madrid", "Alcobendas", "Getafe", "Leganés", "Móstoles"]
+    eventos = []
+    for i in range(size):
+        day = rnd.randint(1, 28)
+        sesiones = tuple(
+            Sesion(id=i*10+s, fecha=f"2024-03-{day:02d} {rnd.randint(10, 22)}:00")
+            for s in range(rnd.randint(0, 4))
+        )
+        eventos.append(Evento(
+            id=i,
+            img=f"https://compras.abonoteatro.com/wp-content/uploads/2024/03/{i}.jpg",
+            precio=rnd.choice((10, 12.5, 15, 20)),
+            categoria=rnd.choice(("teatro", "cine", "musica")),
+            lugar=Lugar(txt=f"Teatro {i % 50}", direccion="Calle Mayor " + rnd.choice(municipios)),
+            sesiones=sesiones,
+            txt=f"OBRA NÚMERO {i}",
+            subtitulo=rnd.choice((None, "con la intervención de alguien.")),
+            publicado=f"2024-{rnd.randint(1, 2):02d}-{day:02d} 10:00",
+            creado=rnd.choice((None, f"2024-01-{day:02d} 09:00"))
+        ))
+    return tuple(eventos)
+
+
+def best(fnc):
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        data = fnc()
+        times.append(time.perf_counter() - start)
+    return min(times), data
+
+
+for size in args.sizes:
+    eventos = build_eventos(size)
+    # lo mismo que guarda TupleCache en rec/eventos.json
+    js = json.dumps([
+        dict(asdict(e), lugar=e.lugar._asdict(), sesiones=[s._asdict() for s in e.sesiones])
+        for e in eventos
+    ], indent=2).encode()
+    snap = EVENTO_SNAPSHOT.dumps(eventos)
+    t_js, from_js = best(lambda: tuple(Evento.build(d) for d in json.loads(js.decode())))
+    t_snap, from_snap = best(lambda: EVENTO_SNAPSHOT.loads(snap))
+    if from_js != from_snap or from_snap != eventos:
+        raise SystemExit(f"{size} eventos: ¡el snapshot no coincide con el json!")
+    print(
+        f"{size:>7} eventos: json {t_js:8.3f}s {len(js)/1024:9.0f}KB"
+        f" | snapshot {t_snap:8.3f}s {len(snap)/1024:9.0f}KB (x{t_js/t_snap:.1f})"
+    )
@@ -0,0 +1,87 @@
+"""
+Mide sort_eventos (agrupación por título y lugar en una sola pasada)
+frente a la implementación cuadrática anterior con listas sintéticas de eventos
+
+    python3 -m tool.bench_sorted [--sizes 1000 10000 100000] [--max-legacy 2000]
+"""
+import argparse
+import random
+import time
+from os import environ
+
+environ.setdefault("PROGRAMA_TOKEN", "")
+
+from core.api import Evento, Lugar, Sesion, sort_eventos  # noqa: E402
+
+parser = argparse.ArgumentParser(description='Benchmark de sort_eventos')
+parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+parser.add_argument('--max-legacy', type=int, default=2000,
+                    help='Tamaño máximo con el que se ejecuta la versión cuadrática')
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+
+def legacy_sorted(eventos):
+    def get_key(e: Evento):
+        return (e.titulo.lower(), e.lugar.direccion.strip().split()[-1])
+    arr1 = sorted(
+        eventos,
+        key=lambda e: (
+            e.publicado,
+            e.creado or e.publicado,
+            e.precio,
+            len(e.sesiones),
+            e.txt,
+            e.id
+        )
+    )
+    arr2 = []
+    for i1, e1 in enumerate(arr1):
+        if e1 in arr2:
+            continue
+        arr2.append(e1)
+        for e2 in arr1[i1+1:]:
+            if get_key(e1) == get_key(e2):
+                arr2.append(e2)
+    return tuple(reversed(arr2))
+
+
+def build_eventos(size: int):
+    rnd = random.Random(args.seed)
+    titulos = [f"Obra {i}" for i in range(max(1, size // 3))]
+    municipios = ["Madrid", "Alcobendas", "Getafe", "Leganés", "Móstoles"]
+    eventos = []
+    for i in range(size):
+        day = rnd.randint(1, 28)
+        sesiones = tuple(
+            Sesion(id=i*10+s, fecha=f"2024-03-{day:02d} {rnd.randint(10, 22)}:00")
+            for s in range(rnd.randint(0, 4))
+        )
+        eventos.append(Evento(
+            id=i,
+            img=None,
+            precio=rnd.choice((10, 12.5, 15, 20)),
+            categoria="teatro",
+            lugar=Lugar(txt="Teatro", direccion="Calle Mayor " + rnd.choice(municipios)),
+            sesiones=sesiones,
+            txt=rnd.choice(titulos),
+            publicado=f"2024-{rnd.randint(1, 2):02d}-{day:02d} 10:00",
+            creado=rnd.choice((None, f"2024-01-{day:02d} 09:00"))
+        ))
+    return eventos
+
+
+for size in args.sizes:
+    eventos = build_eventos(size)
+    start = time.perf_counter()
+    new = sort_eventos(eventos)
+    t_new = time.perf_counter() - start
+    line = f"{size:>7} eventos: sort_eventos {t_new:8.3f}s"
+    if size <= args.max_legacy:
+        start = time.perf_counter()
+        old = legacy_sorted(eventos)
+        t_old = time.perf_counter() - start
+        line = line + f" | cuadrático {t_old:8.3f}s (x{t_old/t_new:.0f})"
+        if old != new:
+            raise SystemExit(line + " | ¡ORDEN DISTINTO!")
+    print(line)